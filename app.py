@@ -1,9 +1,34 @@
 import os
+import re
+import csv
+import io
+import gzip
+import hmac
 import json
+import time
+import random
+import heapq
+import uuid
+import signal
 import sqlite3
-from datetime import datetime, timezone, timedelta
-from functools import wraps
-from flask import Flask, render_template, request, redirect, url_for, flash, g, session, jsonify, Response
+import tempfile
+import base64
+import shutil
+import tarfile
+import hashlib
+import itertools
+import mimetypes
+import threading
+import urllib.request
+from difflib import SequenceMatcher
+from datetime import date, datetime, timezone, timedelta
+from functools import wraps, lru_cache
+from zoneinfo import ZoneInfo
+import click
+from flask import (Flask, render_template, request, redirect, url_for, flash, g, session, jsonify, send_file,
+                   abort, has_request_context, Response, stream_with_context, before_render_template,
+                   template_rendered)
+from werkzeug.utils import secure_filename, safe_join
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'dev-secret-change-me-in-production')
@@ -21,54 +46,285 @@ def login_required(f):
 DATABASE_URL = os.environ.get('DATABASE_URL')
 USE_POSTGRES = DATABASE_URL is not None
 
-if USE_POSTGRES:
-    import psycopg
-    from psycopg.rows import dict_row
+# Imported by load_backend() so SQLite deployments never load the Postgres driver
+psycopg = dict_row = None
 
 SQLITE_PATH = os.path.join(app.root_path, 'crm.db')
 
+# Optional read replica for GET requests: DATABASE_READ_URL on Postgres, or a
+# second SQLite file kept current by `flask sync-replica` for local testing.
+DATABASE_READ_URL = os.environ.get('DATABASE_READ_URL')
+SQLITE_READ_PATH = os.environ.get('SQLITE_READ_PATH')
+USE_READ_REPLICA = bool(DATABASE_READ_URL if USE_POSTGRES else SQLITE_READ_PATH)
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get('REPLICA_MAX_LAG_SECONDS', '5'))
+REPLICA_CHECK_SECONDS = float(os.environ.get('REPLICA_CHECK_SECONDS', '5'))
+# After a write, the session reads from the primary for this long so users see their own changes
+PRIMARY_STICKY_SECONDS = float(os.environ.get('PRIMARY_STICKY_SECONDS', '30'))
+
+
+def to_db_text(value):
+    """Format a datetime the way CURRENT_TIMESTAMP stores it (naive UTC)."""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.strftime('%Y-%m-%d %H:%M:%S.%f' if value.microsecond else '%Y-%m-%d %H:%M:%S')
+
+
+def parse_timestamp(value):
+    """Parse a stored timestamp string, or return None if it isn't one."""
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+def convert_timestamp(raw):
+    # Columns declared TIMESTAMP come back as datetimes, like psycopg returns them.
+    # Anything that doesn't parse (hand-edited rows, old imports) stays a string.
+    text = raw.decode('utf-8')
+    return parse_timestamp(text) or text
+
+
+# Formats older proposal rows used for their free-text date columns
+CALENDAR_DATE_FORMATS = ('%m/%d/%Y', '%m/%d/%y', '%m-%d-%Y', '%Y/%m/%d', '%b %d, %Y', '%B %d, %Y',
+                         '%b %d %Y', '%B %d %Y', '%d %b %Y', '%d %B %Y')
+
+
+def parse_calendar_date(value):
+    """Parse a calendar date from a date, ISO text or one of CALENDAR_DATE_FORMATS; None if it isn't one."""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    text = (value or '').strip()
+    if not text:
+        return None
+    try:
+        return date.fromisoformat(text[:10])
+    except ValueError:
+        pass
+    for fmt in CALENDAR_DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def convert_date(raw):
+    # Columns declared DATE come back as dates, like psycopg returns them
+    text = raw.decode('utf-8')
+    return parse_calendar_date(text) or text
+
+
+sqlite3.register_adapter(datetime, to_db_text)
+sqlite3.register_adapter(date, date.isoformat)
+sqlite3.register_converter('TIMESTAMP', convert_timestamp)
+sqlite3.register_converter('DATE', convert_date)
+
+
+# Distinct statements kept translated here, and prepared per connection by the driver
+STATEMENT_CACHE_SIZE = int(os.environ.get('STATEMENT_CACHE_SIZE', '512'))
+# Executions before psycopg prepares a statement server-side; 'none' disables
+# preparing (needed behind pgbouncer in transaction pooling mode)
+PG_PREPARE_THRESHOLD = os.environ.get('PG_PREPARE_THRESHOLD', '1')
+
+
+# GET endpoints that show state written by the job worker or another session
+# rather than by this one, so replica lag would show stale data
+PRIMARY_READ_ENDPOINTS = {'jobs', 'job_status', 'job_status_api', 'download_job_output', 'duplicates',
+                          'follow_up_cards_view', 'follow_up_events'}
+
+_replica_state = {'checked_at': 0.0, 'fresh': False}
+
+
+def load_backend():
+    global psycopg, dict_row
+    if USE_POSTGRES and psycopg is None:
+        import psycopg as driver
+        from psycopg.rows import dict_row as row_factory
+        psycopg, dict_row = driver, row_factory
+
+
+def connect_db(role='primary'):
+    if USE_POSTGRES:
+        load_backend()
+        db = psycopg.connect(DATABASE_READ_URL if role == 'replica' else DATABASE_URL,
+                             row_factory=dict_row, autocommit=False)
+        db.prepare_threshold = None if PG_PREPARE_THRESHOLD == 'none' else int(PG_PREPARE_THRESHOLD)
+        db.prepared_max = STATEMENT_CACHE_SIZE
+    else:
+        # The replica is opened read-only so a missing file fails instead of being created empty
+        path, uri = (f'file:{SQLITE_READ_PATH}?mode=ro', True) if role == 'replica' else (SQLITE_PATH, False)
+        db = sqlite3.connect(path, uri=uri, detect_types=sqlite3.PARSE_DECLTYPES,
+                             cached_statements=STATEMENT_CACHE_SIZE)
+        db.row_factory = sqlite3.Row
+    count_connection('opened', role)
+    return db
+
+
+def replica_lag(db):
+    """Seconds the replica is behind the primary."""
+    if USE_POSTGRES:
+        row = db.execute(
+            'SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+            'ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END AS lag').fetchone()
+        db.rollback()
+        # NULL means the server isn't streaming from a primary; treat it as current
+        return float(row['lag'] or 0)
+    # The replica file is rewritten on each sync, so a primary written since then
+    # may be missing up to the time since that sync
+    synced_at = os.path.getmtime(SQLITE_READ_PATH)
+    if os.path.getmtime(SQLITE_PATH) <= synced_at:
+        return 0.0
+    return time.time() - synced_at
+
+
+def open_replica():
+    """Return a replica connection if it is reachable and within REPLICA_MAX_LAG_SECONDS.
+
+    Reachability and lag are checked at most every REPLICA_CHECK_SECONDS per
+    process; in between, an unhealthy replica is skipped without connecting.
+    """
+    now = time.monotonic()
+    due = now - _replica_state['checked_at'] >= REPLICA_CHECK_SECONDS
+    if not due and not _replica_state['fresh']:
+        return None
+    db, fresh = None, _replica_state['fresh']
+    try:
+        db = connect_db('replica')
+        if due:
+            fresh = replica_lag(db) <= REPLICA_MAX_LAG_SECONDS
+    except Exception:
+        app.logger.warning('Replica unavailable; reading from the primary', exc_info=True)
+        fresh = False
+    if due:
+        _replica_state.update(checked_at=now, fresh=fresh)
+    if db is not None and not fresh:
+        db.close()
+        count_connection('closed', 'replica')
+        return None
+    return db
+
+
+def wants_replica():
+    return (USE_READ_REPLICA and has_request_context() and request.method in ('GET', 'HEAD')
+            and request.endpoint not in PRIMARY_READ_ENDPOINTS
+            and session.get('primary_until', 0) < time.time())
+
 
 def get_db():
     if 'db' not in g:
-        if USE_POSTGRES:
-            g.db = psycopg.connect(DATABASE_URL, row_factory=dict_row, autocommit=False)
-        else:
-            g.db = sqlite3.connect(SQLITE_PATH)
-            g.db.row_factory = sqlite3.Row
+        replica = open_replica() if wants_replica() else None
+        g.db, g.db_role = (replica, 'replica') if replica is not None else (connect_db('primary'), 'primary')
     return g.db
 
 
+@lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+def prepare_statement(sql):
+    """Translate and classify a statement once.
+
+    Returns (driver_sql, is_select, returns_id). Placeholders become %s for
+    Postgres; everything else is either a SELECT, a write with RETURNING, or a
+    plain write.
+    """
+    driver_sql = sql.replace('?', '%s') if USE_POSTGRES else sql
+    head = sql.lstrip()[:6].upper()
+    return driver_sql, head == 'SELECT' or head.startswith('WITH'), 'RETURNING' in sql.upper()
+
+
 def query_db(sql, args=(), one=False, insert=False):
     db = get_db()
-    if USE_POSTGRES:
-        # Convert ? placeholders to %s for postgres
-        sql = sql.replace('?', '%s')
-        cur = db.execute(sql, args)
-        if insert:
-            if 'RETURNING' in sql.upper():
-                row = cur.fetchone()
-                return row['id'] if row else None
-            return None
-        if sql.strip().upper().startswith('SELECT'):
-            rows = cur.fetchall()
-            return rows[0] if one and rows else rows if not one else None
-        return None
-    else:
-        cur = db.execute(sql, args)
-        if insert:
-            if 'RETURNING' not in sql.upper():
-                return cur.lastrowid
+    driver_sql, is_select, returns_id = prepare_statement(sql)
+    if not is_select and g.db_role == 'replica':
+        # A GET handler is writing; finish the request on the primary
+        app.logger.warning('Write during a replica-routed %s %s; switching to the primary', request.method, request.path)
+        db.close()
+        count_connection('closed', 'replica')
+        g.db, g.db_role = connect_db('primary'), 'primary'
+        db = g.db
+    started = time.perf_counter()
+    cur = db.execute(driver_sql, args)
+    if insert:
+        if returns_id:
             row = cur.fetchone()
-            return row['id'] if row else None
-        if sql.strip().upper().startswith('SELECT'):
-            rows = cur.fetchall()
-            return rows[0] if one and rows else rows if not one else None
-        return None
+            result = row['id'] if row else None
+        else:
+            result = None if USE_POSTGRES else cur.lastrowid
+    elif is_select:
+        rows = cur.fetchall()
+        result = rows[0] if one and rows else rows if not one else None
+    else:
+        result = None
+    g.db_seconds = g.get('db_seconds', 0.0) + (time.perf_counter() - started)
+    return result
 
 
 def commit_db():
     db = get_db()
+    started = time.perf_counter()
     db.commit()
+    g.db_seconds = g.get('db_seconds', 0.0) + (time.perf_counter() - started)
+
+
+def rollback_db():
+    db = get_db()
+    db.rollback()
+
+
+_cursor_names = itertools.count(1)
+
+
+def iter_query(sql, args=(), size=5000):
+    """Yield rows in batches instead of loading the whole result set."""
+    db = get_db()
+    if USE_POSTGRES:
+        # Named cursors are server-side, so only `size` rows are held client-side at a time
+        with db.cursor(name=f'crm_iter_{next(_cursor_names)}') as cur:
+            cur.itersize = size
+            cur.execute(prepare_statement(sql)[0], args)
+            yield from cur
+    else:
+        cur = db.execute(sql, args)
+        while True:
+            rows = cur.fetchmany(size)
+            if not rows:
+                break
+            yield from rows
+
+
+# Keep IN (...) lists well under SQLite's bound-parameter limit
+IN_BATCH_SIZE = 500
+
+
+def chunked(items, size=IN_BATCH_SIZE):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def placeholders(n):
+    return ', '.join('?' * n)
+
+
+def insert_rows(table, columns, rows, suffix=''):
+    """Insert many rows using multi-row VALUES statements, chunked to stay under parameter limits."""
+    if not rows:
+        return
+    row_marks = '(' + ', '.join('?' * len(columns)) + ')'
+    per_statement = max(1, 900 // len(columns))
+    for start in range(0, len(rows), per_statement):
+        batch = rows[start:start + per_statement]
+        query_db(
+            f'INSERT INTO {table} ({", ".join(columns)}) VALUES {", ".join([row_marks] * len(batch))} {suffix}'.rstrip(),
+            [value for row in batch for value in row]
+        )
+
+
+@app.after_request
+def stick_to_primary(response):
+    if USE_READ_REPLICA and request.method not in ('GET', 'HEAD', 'OPTIONS'):
+        session['primary_until'] = time.time() + PRIMARY_STICKY_SECONDS
+    return response
 
 
 @app.teardown_appcontext
@@ -76,10 +332,41 @@ def close_db(exception):
     db = g.pop('db', None)
     if db is not None:
         db.close()
+        count_connection('closed', g.get('db_role', 'primary'))
+
+
+def has_column(table, column):
+    if USE_POSTGRES:
+        sql = 'SELECT 1 FROM information_schema.columns WHERE table_name = ? AND column_name = ?'
+    else:
+        sql = 'SELECT 1 FROM pragma_table_info(?) WHERE name = ?'
+    return query_db(sql, (table, column), one=True) is not None
+
+
+def has_index(name):
+    if USE_POSTGRES:
+        sql = 'SELECT 1 FROM pg_indexes WHERE indexname = ?'
+    else:
+        sql = "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?"
+    return query_db(sql, (name,), one=True) is not None
 
 
 def init_db():
+    if 'db' not in g:
+        # Migrate on the primary even when the first request to trigger this is a replica-routed GET
+        g.db, g.db_role = connect_db('primary'), 'primary'
     db = get_db()
+    had_counters = has_column('follow_ups', 'pipeline_retainer')
+    had_funnel = has_column('funnel_reached', 'proposals')
+    had_due_dates = has_column('proposals', 'follow_up_on')
+    # Drop duplicate link/contact rows before the schema adds unique indexes over them
+    for table, index, key in [
+        ('follow_up_links', 'idx_follow_up_links_unique', 'follow_up_id, entity_type, entity_id'),
+        ('proposal_contacts', 'idx_proposal_contacts_unique', 'proposal_id, individual_id'),
+    ]:
+        if has_column(table, 'id') and not has_index(index):
+            query_db(f'DELETE FROM {table} WHERE id NOT IN (SELECT MIN(id) FROM {table} GROUP BY {key})')
+            commit_db()
     if USE_POSTGRES:
         with app.open_resource('schema_pg.sql') as f:
             cur = db.cursor()
@@ -101,37 +388,246 @@ def init_db():
             'ALTER TABLE proposals ADD COLUMN monthly_retainer REAL',
             'ALTER TABLE proposals ADD COLUMN onboarding_fee_max REAL',
             'ALTER TABLE proposals ADD COLUMN monthly_retainer_max REAL',
-        ]:
+            'ALTER TABLE proposals ADD COLUMN sent_on DATE',
+            'ALTER TABLE proposals ADD COLUMN follow_up_on DATE',
+            'ALTER TABLE archived_proposals ADD COLUMN sent_on DATE',
+            'ALTER TABLE archived_proposals ADD COLUMN follow_up_on DATE',
+            # Here rather than in schema.sql, which runs before existing tables get the column
+            'CREATE INDEX IF NOT EXISTS idx_proposals_follow_up_on ON proposals (follow_up_on)',
+        ] + [f'ALTER TABLE {table} ADD COLUMN {column}' for table, columns in COUNTER_COLUMNS.items()
+             for column in columns]:
             try:
                 db.execute(stmt)
                 db.commit()
             except Exception:
                 pass
+    if not had_counters:
+        # Counter columns were just added; fill them from the existing rows
+        rebuild_counters()
+        commit_db()
+    if not had_funnel:
+        rebuild_funnel()
+        commit_db()
+    if not had_due_dates:
+        backfill_proposal_dates()
+        commit_db()
+
+
+# --- App Factory ---
+
+_initialized = False
+_init_lock = threading.Lock()
+
+
+def create_app():
+    """Initialize the app once per process and return it.
+
+    Phases: load the database driver, create/migrate the schema, then compile
+    every template and read the asset manifest. gunicorn.conf.py serves `app:create_app()` with preload_app,
+    so this runs once in the master and workers fork with it all in memory,
+    shared copy-on-write; its post_fork hook then calls reset_after_fork().
+    """
+    global _initialized
+    with _init_lock:
+        if not _initialized:
+            load_backend()
+            with app.app_context():
+                init_db()
+            for name in app.jinja_env.list_templates():
+                app.jinja_env.get_template(name)
+            asset_manifest()
+            _initialized = True
+    return app
+
+
+def reset_after_fork():
+    """Drop per-process state a forked worker must not inherit from the master."""
+    global _init_lock, _worker_thread, _worker_lock, _rss_sampled_at
+    _init_lock = threading.Lock()
+    _worker_thread, _worker_lock = None, threading.Lock()
+    _replica_state.update(checked_at=0.0, fresh=False)
+    _rss_sampled_at = 0.0
+
+
+@app.before_request
+def ensure_initialized():
+    # `flask run`, tests and `gunicorn app:app` load the bare app; initialize it on the first request
+    if not _initialized:
+        create_app()
+
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Create the schema and run pending migrations."""
+    create_app()
+    click.echo('Database initialized.')
+
+
+# --- Counter Caches ---
+
+ENTITY_TABLES = {'company': 'companies', 'individual': 'individuals'}
+PROPOSAL_STATUSES = ('Draft', 'Sent', 'Negotiating', 'Won', 'Lost')
+OPEN_PROPOSAL_STATUSES = ('Draft', 'Sent', 'Negotiating')
+
+# Column definitions for the SQLite migration; schema.sql/schema_pg.sql declare the same
+COUNTER_COLUMNS = {
+    'companies': ['note_count INTEGER DEFAULT 0', 'relationship_count INTEGER DEFAULT 0',
+                  'open_follow_up_count INTEGER DEFAULT 0'],
+    'individuals': ['note_count INTEGER DEFAULT 0', 'relationship_count INTEGER DEFAULT 0',
+                    'open_follow_up_count INTEGER DEFAULT 0'],
+    'follow_ups': ['comment_count INTEGER DEFAULT 0'] + [
+        f'{status.lower()}_proposal_count INTEGER DEFAULT 0' for status in PROPOSAL_STATUSES
+    ] + ['pipeline_retainer REAL DEFAULT 0'],
+}
+
+
+def refresh_entity_counters(entity_type, ids=None):
+    """Recount notes, relationships and open opportunities for some or all companies/individuals.
+
+    Counts are recomputed from the child tables rather than incremented, so a
+    refresh also corrects any drift on the rows it touches.
+    """
+    table = ENTITY_TABLES[entity_type]
+    assignments = (
+        f'note_count = (SELECT COUNT(*) FROM notes n WHERE n.entity_type = ? AND n.entity_id = {table}.id), '
+        f'relationship_count = (SELECT COUNT(*) FROM relationships r WHERE r.from_type = ? AND r.from_id = {table}.id)'
+        f' + (SELECT COUNT(*) FROM relationships r WHERE r.to_type = ? AND r.to_id = {table}.id), '
+        f'open_follow_up_count = (SELECT COUNT(DISTINCT l.follow_up_id) FROM follow_up_links l '
+        f'JOIN follow_ups f ON f.id = l.follow_up_id '
+        f'WHERE l.entity_type = ? AND l.entity_id = {table}.id AND f.closed_at IS NULL)'
+    )
+    args = [entity_type] * 4
+    if ids is None:
+        query_db(f'UPDATE {table} SET {assignments}', args)
+        return
+    for batch in chunked(set(ids)):
+        query_db(f'UPDATE {table} SET {assignments} WHERE id IN ({placeholders(len(batch))})', args + batch)
+
+
+def refresh_follow_up_counters(ids=None):
+    """Recount comments, proposals per status and open pipeline retainer for some or all follow-ups."""
+    status_counts = ', '.join(
+        f"{status.lower()}_proposal_count = (SELECT COUNT(*) FROM proposals p "
+        f"WHERE p.follow_up_id = follow_ups.id AND p.status = '{status}')"
+        for status in PROPOSAL_STATUSES
+    )
+    open_statuses = ', '.join(f"'{status}'" for status in OPEN_PROPOSAL_STATUSES)
+    assignments = (
+        f'comment_count = (SELECT COUNT(*) FROM follow_up_comments c WHERE c.follow_up_id = follow_ups.id), '
+        f'{status_counts}, '
+        f'pipeline_retainer = (SELECT COALESCE(SUM(p.monthly_retainer), 0) FROM proposals p '
+        f'WHERE p.follow_up_id = follow_ups.id AND p.status IN ({open_statuses}))'
+    )
+    if ids is None:
+        query_db(f'UPDATE follow_ups SET {assignments}')
+        return
+    for batch in chunked({i for i in ids if i}):
+        query_db(f'UPDATE follow_ups SET {assignments} WHERE id IN ({placeholders(len(batch))})', batch)
+
+
+def follow_up_entities(follow_up_ids):
+    """Return the (entity_type, id) pairs linked to any of the given follow-ups."""
+    nodes = set()
+    for batch in chunked({i for i in follow_up_ids if i}):
+        rows = query_db(f'SELECT entity_type, entity_id FROM follow_up_links '
+                        f'WHERE follow_up_id IN ({placeholders(len(batch))})', batch)
+        nodes.update((r['entity_type'], r['entity_id']) for r in rows)
+    return nodes
+
+
+def related_entities(nodes):
+    """Return the (entity_type, id) pairs on the other end of any relationship of the given nodes."""
+    related = set()
+    for entity_type in ENTITY_TABLES:
+        ids = [entity_id for node_type, entity_id in nodes if node_type == entity_type]
+        for batch in chunked(ids):
+            marks = placeholders(len(batch))
+            rows = query_db(
+                f'SELECT to_type AS other_type, to_id AS other_id FROM relationships '
+                f'WHERE from_type = ? AND from_id IN ({marks}) '
+                f'UNION SELECT from_type, from_id FROM relationships WHERE to_type = ? AND to_id IN ({marks})',
+                [entity_type] + batch + [entity_type] + batch
+            )
+            related.update((r['other_type'], r['other_id']) for r in rows)
+    return related
+
+
+def refresh_counters(entities=(), follow_up_ids=()):
+    """Refresh the counter caches of the given (entity_type, id) pairs and follow-ups."""
+    for entity_type in ENTITY_TABLES:
+        ids = [entity_id for node_type, entity_id in entities if node_type == entity_type]
+        if ids:
+            refresh_entity_counters(entity_type, ids)
+    if follow_up_ids:
+        refresh_follow_up_counters(follow_up_ids)
 
 
-with app.app_context():
-    init_db()
+def rebuild_counters():
+    for entity_type in ENTITY_TABLES:
+        refresh_entity_counters(entity_type)
+    refresh_follow_up_counters()
+
+
+@app.cli.command('rebuild-counters')
+def rebuild_counters_command():
+    """Recompute every counter cache column from the child tables."""
+    create_app()
+    rebuild_counters()
+    commit_db()
+    click.echo('Counters rebuilt.')
+
+
+DISPLAY_TIMEZONE = ZoneInfo(os.environ.get('DISPLAY_TIMEZONE', 'America/Los_Angeles'))
+
+
+@lru_cache(maxsize=4096)
+def format_local_datetime(value):
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(DISPLAY_TIMEZONE).strftime('%b %d, %Y %I:%M %p')
 
 
 @app.template_filter('datefmt')
 def datefmt(value):
+    """Render a UTC timestamp in DISPLAY_TIMEZONE, e.g. 'Mar 04, 2025 09:15 AM'."""
     if not value:
         return ''
     if isinstance(value, str):
-        for fmt in ('%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S'):
-            try:
-                value = datetime.strptime(value, fmt)
-                break
-            except ValueError:
-                continue
-        else:
+        parsed = parse_timestamp(value)
+        if parsed is None:
             return value
-    # Convert UTC to Pacific Time (UTC-8, or UTC-7 during DST)
-    if value.tzinfo is None:
-        value = value.replace(tzinfo=timezone.utc)
-    pacific = timezone(timedelta(hours=-8))
-    value = value.astimezone(pacific)
-    return value.strftime('%b %d, %Y %I:%M %p')
+        value = parsed
+    return format_local_datetime(value)
+
+
+@app.cli.command('bench-datefmt')
+@click.option('--rows', default=100000, show_default=True, help='Rows to render.')
+@click.option('--distinct', default=5000, show_default=True, help='Distinct timestamps among the rows.')
+def bench_datefmt_command(rows, distinct):
+    """Time the datefmt filter rendering a table of timestamps."""
+    create_app()
+    start = datetime(2024, 1, 1)
+    values = [start + timedelta(minutes=37 * (n % distinct)) for n in range(rows)]
+    random.Random(0).shuffle(values)
+    template = app.jinja_env.from_string('{% for v in values %}<td>{{ v|datefmt }}</td>{% endfor %}')
+
+    def timed(label, rendered_values):
+        format_local_datetime.cache_clear()
+        began = time.perf_counter()
+        template.render(values=rendered_values)
+        elapsed = time.perf_counter() - began
+        click.echo(f'{label:<28} {elapsed * 1000:8.1f} ms  {elapsed / rows * 1e6:6.2f} us/row')
+
+    timed('typed datetimes', values)
+    hits = format_local_datetime.cache_info()
+    timed('timestamp strings', [to_db_text(v) for v in values])
+    original = app.jinja_env.filters['datefmt']
+    app.jinja_env.filters['datefmt'] = lambda v: format_local_datetime.__wrapped__(v) if v else ''
+    try:
+        timed('typed datetimes, no cache', values)
+    finally:
+        app.jinja_env.filters['datefmt'] = original
+    click.echo(f'cache: {hits.hits} hits, {hits.misses} misses')
 
 
 # --- Auth ---
@@ -157,32 +653,39 @@ def logout():
 
 # --- Home / Search ---
 
+def load_follow_up_data(fu_list):
+    """Attach linked entities, comments and proposals to each follow-up, one query per table per batch."""
+    fu_list = list(fu_list)
+    ids = [fu['id'] for fu in fu_list]
+    links = {fu_id: [] for fu_id in ids}
+    comments = {fu_id: [] for fu_id in ids}
+    proposals_by_fu = {fu_id: [] for fu_id in ids}
+    for batch in chunked(set(ids)):
+        marks = placeholders(len(batch))
+        for row in query_db(
+            f"SELECT l.follow_up_id, l.entity_type, COALESCE(c.id, i.id) AS id, COALESCE(c.name, i.name) AS name "
+            f"FROM follow_up_links l "
+            f"LEFT JOIN companies c ON l.entity_type = 'company' AND c.id = l.entity_id "
+            f"LEFT JOIN individuals i ON l.entity_type = 'individual' AND i.id = l.entity_id "
+            f"WHERE l.follow_up_id IN ({marks}) ORDER BY l.id", batch
+        ):
+            if row['id'] is not None:
+                links[row['follow_up_id']].append({'type': row['entity_type'], 'id': row['id'], 'name': row['name']})
+        for row in query_db(f'SELECT * FROM follow_up_comments WHERE follow_up_id IN ({marks}) '
+                            f'ORDER BY created_at ASC, id', batch):
+            comments[row['follow_up_id']].append(row)
+        for row in query_db(f'SELECT id, name, status, follow_up_id FROM proposals '
+                            f'WHERE follow_up_id IN ({marks}) ORDER BY id', batch):
+            proposals_by_fu[row['follow_up_id']].append(row)
+    return [{'follow_up': fu, 'links': links[fu['id']], 'comments': comments[fu['id']],
+             'proposals': proposals_by_fu[fu['id']]} for fu in fu_list]
+
+
 @app.route('/')
 @login_required
 def index():
     q = request.args.get('q', '').strip()
 
-    def load_follow_up_data(fu_list):
-        result = []
-        for fu in fu_list:
-            links = query_db('SELECT * FROM follow_up_links WHERE follow_up_id = ?', (fu['id'],))
-            linked_entities = []
-            for link in links:
-                if link['entity_type'] == 'company':
-                    entity = query_db('SELECT id, name FROM companies WHERE id = ?', (link['entity_id'],), one=True)
-                else:
-                    entity = query_db('SELECT id, name FROM individuals WHERE id = ?', (link['entity_id'],), one=True)
-                if entity:
-                    linked_entities.append({'type': link['entity_type'], 'id': entity['id'], 'name': entity['name']})
-            comments = query_db(
-                'SELECT * FROM follow_up_comments WHERE follow_up_id = ? ORDER BY created_at ASC', (fu['id'],)
-            )
-            linked_proposals = query_db(
-                'SELECT id, name, status FROM proposals WHERE follow_up_id = ?', (fu['id'],)
-            )
-            result.append({'follow_up': fu, 'links': linked_entities, 'comments': comments, 'proposals': linked_proposals})
-        return result
-
     if q:
         follow_ups = query_db(
             'SELECT * FROM follow_ups WHERE closed_at IS NULL AND (title LIKE ? OR body LIKE ?) ORDER BY sort_order, created_at DESC',
@@ -195,19 +698,233 @@ def index():
             'SELECT * FROM follow_ups WHERE closed_at IS NOT NULL AND (title LIKE ? OR body LIKE ?) ORDER BY closed_at DESC',
             (f'%{q}%', f'%{q}%')
         )
+        archived_matches = query_db('SELECT COUNT(*) AS n FROM archived_follow_ups WHERE title LIKE ? OR body LIKE ?',
+                                    (f'%{q}%', f'%{q}%'), one=True)['n']
+        due = None
     else:
         all_follow_ups = query_db('SELECT * FROM follow_ups WHERE closed_at IS NULL ORDER BY sort_order, created_at DESC')
-        priority_follow_ups = query_db('SELECT * FROM follow_ups WHERE closed_at IS NULL AND priority_level = 2 ORDER BY priority_order, created_at DESC')
-        watch_follow_ups = query_db('SELECT * FROM follow_ups WHERE closed_at IS NULL AND priority_level = 1 ORDER BY priority_order, created_at DESC')
         follow_up_data = load_follow_up_data(all_follow_ups)
-        priority_data = load_follow_up_data(priority_follow_ups)
-        watch_data = load_follow_up_data(watch_follow_ups)
+        # Flagged columns show the same open cards in priority order. Sorting the loaded items
+        # (rather than querying again) keeps every column on one consistent snapshot.
+        by_created = sorted(follow_up_data, key=lambda item: item['follow_up']['created_at'], reverse=True)
+        by_priority = sorted(by_created, key=lambda item: item['follow_up']['priority_order'] or 0)
+        priority_data = [item for item in by_priority if item['follow_up']['priority_level'] == 2]
+        watch_data = [item for item in by_priority if item['follow_up']['priority_level'] == 1]
         closed_follow_ups = query_db('SELECT * FROM follow_ups WHERE closed_at IS NOT NULL ORDER BY closed_at DESC')
+        archived_matches = 0
+        due = due_summary()
     closed_data = load_follow_up_data(closed_follow_ups)
 
     return render_template('index.html', query=q,
                            follow_up_data=follow_up_data, priority_data=priority_data, watch_data=watch_data,
-                           closed_data=closed_data)
+                           closed_data=closed_data, archived_matches=archived_matches, due=due,
+                           live_updates=LIVE_UPDATES)
+
+
+# --- Dashboard Cards ---
+
+# Dashboard actions can answer with just the re-rendered cards of the follow-up
+# they changed (?partial=json|html or Accept: application/json) instead of a
+# redirect that reloads the whole board.
+CARD_VARIANTS = ('priority', 'watch', 'open', 'closed')
+
+# Optional Server-Sent Events stream so other open tabs refresh changed cards.
+# Each stream holds a worker for up to LIVE_STREAM_SECONDS, so only enable it
+# with a threaded or async gunicorn worker.
+LIVE_UPDATES = os.environ.get('LIVE_UPDATES', '') == '1'
+LIVE_POLL_SECONDS = float(os.environ.get('LIVE_POLL_SECONDS', '1'))
+LIVE_STREAM_SECONDS = float(os.environ.get('LIVE_STREAM_SECONDS', '300'))
+LIVE_KEEPALIVE_SECONDS = 15
+LIVE_EVENT_RETENTION = 1000
+
+
+def card_variants(fu):
+    """The dashboard columns a follow-up currently appears in."""
+    if fu['closed_at'] is not None:
+        return ('closed',)
+    return ('open',) + {2: ('priority',), 1: ('watch',)}.get(fu['priority_level'], ())
+
+
+def partial_format():
+    fmt = request.args.get('partial')
+    if fmt in ('json', 'html'):
+        return fmt
+    if request.accept_mimetypes.best == 'application/json':
+        return 'json'
+    return None
+
+
+def follow_up_cards(id):
+    """Render every dashboard card of a follow-up, keyed by column; None means the card is not in that column."""
+    fu = query_db('SELECT * FROM follow_ups WHERE id = ?', (id,), one=True)
+    cards = dict.fromkeys(CARD_VARIANTS)
+    if fu:
+        item = load_follow_up_data([fu])[0]
+        for variant in card_variants(fu):
+            cards[variant] = render_template('_follow_up_card.html', item=item, variant=variant)
+    return cards
+
+
+def follow_up_cards_response(id, fmt):
+    cards = follow_up_cards(id)
+    if fmt == 'html':
+        return ''.join(card for card in cards.values() if card)
+    return jsonify({'id': id, 'cards': cards})
+
+
+def follow_up_action_response(id, message=None):
+    """Finish a dashboard action: the changed cards for partial requests, otherwise flash and redirect."""
+    fmt = partial_format()
+    if fmt:
+        return follow_up_cards_response(id, fmt)
+    if message:
+        flash(message, 'success')
+    return redirect(url_for('index') + f'#follow-up-{id}')
+
+
+def partial_error(message, status):
+    """Report a failed dashboard action: JSON for partial requests, otherwise flash and go home."""
+    if partial_format():
+        return jsonify({'error': message}), status
+    flash(message, 'error')
+    return redirect(url_for('index'))
+
+
+def publish_follow_up_change(*ids):
+    """Queue a live-update event for each changed follow-up; committed with the caller's transaction."""
+    ids = [i for i in ids if i]
+    if not LIVE_UPDATES or not ids:
+        return
+    insert_rows('ui_events', ('follow_up_id',), [(i,) for i in ids])
+    query_db('DELETE FROM ui_events WHERE id <= (SELECT MAX(id) FROM ui_events) - ?', (LIVE_EVENT_RETENTION,))
+
+
+@app.route('/follow-up/<int:id>/cards')
+@login_required
+def follow_up_cards_view(id):
+    return follow_up_cards_response(id, partial_format() or 'html')
+
+
+@app.route('/events/follow-ups')
+@login_required
+def follow_up_events():
+    if not LIVE_UPDATES:
+        return jsonify({'error': 'Live updates are disabled'}), 404
+    last_id = request.headers.get('Last-Event-ID', type=int)
+    if last_id is None:
+        last_id = query_db('SELECT COALESCE(MAX(id), 0) AS id FROM ui_events', one=True)['id']
+
+    def stream(last_id):
+        yield f'retry: {int(LIVE_POLL_SECONDS * 1000) + 1000}\n\n'
+        deadline = time.monotonic() + LIVE_STREAM_SECONDS
+        last_sent = time.monotonic()
+        while time.monotonic() < deadline:
+            rows = query_db('SELECT id, follow_up_id FROM ui_events WHERE id > ? ORDER BY id', (last_id,))
+            # End the read so Postgres doesn't hold a transaction open between polls
+            rollback_db()
+            latest = {}
+            for row in rows:
+                latest[row['follow_up_id']] = row['id']
+            for fu_id, event_id in sorted(latest.items(), key=lambda e: e[1]):
+                data = json.dumps({'id': fu_id})
+                yield f'id: {event_id}\nevent: follow-up\ndata: {data}\n\n'
+                last_id = event_id
+                last_sent = time.monotonic()
+            if time.monotonic() - last_sent >= LIVE_KEEPALIVE_SECONDS:
+                yield ': keepalive\n\n'
+                last_sent = time.monotonic()
+            time.sleep(LIVE_POLL_SECONDS)
+
+    return Response(stream_with_context(stream(last_id)), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+# --- List Pages ---
+
+LIST_PAGE_SIZE = int(os.environ.get('LIST_PAGE_SIZE', '100'))
+
+# Sort keys for the list pages. Each expression has a matching (expr, id)
+# index in schema.sql so a page is an index range scan no matter how deep it is.
+LIST_SORTS = {
+    'company': {
+        'name': 'name',
+        'type': "COALESCE(type, '')",
+        'created_at': "COALESCE(created_at, '1970-01-01 00:00:00')",
+    },
+    'individual': {
+        'name': 'name',
+        'title': "COALESCE(title, '')",
+        'email': "COALESCE(email, '')",
+        'created_at': "COALESCE(created_at, '1970-01-01 00:00:00')",
+    },
+}
+
+
+def encode_list_cursor(row):
+    return f"{row['id']}:{row['sort_key']}"
+
+
+def decode_list_cursor(value):
+    """Parse an `after` cursor of the form `<id>:<sort value>`; None if invalid."""
+    entity_id, sep, sort_value = (value or '').partition(':')
+    if not sep or not entity_id.isdigit():
+        return None
+    return int(entity_id), sort_value
+
+
+def load_list_page(entity_type, sort, order, conditions, args, after):
+    """Return (rows, next_cursor) for one keyset page of a company/individual list.
+
+    Rows are ordered by the sort expression with `id` as a tiebreak, and the
+    cursor is the last row's (id, sort value), so each page seeks straight to
+    its position instead of counting past an OFFSET.
+    """
+    sort_expr = LIST_SORTS[entity_type].get(sort, 'name')
+    direction, cmp = ('DESC', '<') if order == 'desc' else ('ASC', '>')
+    conditions, args = list(conditions), list(args)
+    cursor = decode_list_cursor(after)
+    if cursor:
+        # The redundant single-column bound lets SQLite seek expression indexes,
+        # which it won't do from the row-value comparison alone.
+        conditions.append(f'{sort_expr} {cmp}= ? AND ({sort_expr}, id) {cmp} (?, ?)')
+        args.extend([cursor[1], cursor[1], cursor[0]])
+    where = f"WHERE {' AND '.join(conditions)} " if conditions else ''
+    rows = query_db(
+        f'SELECT *, {sort_expr} AS sort_key FROM {ENTITY_TABLES[entity_type]} {where}'
+        f'ORDER BY {sort_expr} {direction}, id {direction} LIMIT ?',
+        args + [LIST_PAGE_SIZE + 1]
+    )
+    next_cursor = None
+    if len(rows) > LIST_PAGE_SIZE:
+        rows = rows[:LIST_PAGE_SIZE]
+        next_cursor = encode_list_cursor(rows[-1])
+    return rows, next_cursor
+
+
+def load_relationship_names(entity_type, ids):
+    """Map each id to the names of the entities it is related to, in batches."""
+    others = {entity_id: [] for entity_id in ids}
+    for batch in chunked(list(ids)):
+        marks = placeholders(len(batch))
+        rows = query_db(
+            f'SELECT id, from_id AS entity_id, to_type AS other_type, to_id AS other_id FROM relationships '
+            f'WHERE from_type = ? AND from_id IN ({marks}) '
+            f'UNION ALL '
+            f'SELECT id, to_id AS entity_id, from_type AS other_type, from_id AS other_id FROM relationships '
+            f'WHERE to_type = ? AND to_id IN ({marks}) ORDER BY id',
+            [entity_type] + list(batch) + [entity_type] + list(batch)
+        )
+        for row in rows:
+            others[row['entity_id']].append((row['other_type'], row['other_id']))
+    names = load_entity_names({node for nodes in others.values() for node in nodes})
+    return {entity_id: [names[node] for node in nodes if node in names]
+            for entity_id, nodes in others.items()}
+
+
+def list_filters(names):
+    """Return the non-empty list filters from the query string."""
+    return {name: request.args.get(name, '').strip() for name in names
+            if request.args.get(name, '').strip()}
 
 
 # --- Company List ---
@@ -218,35 +935,27 @@ def company_list():
     q = request.args.get('q', '').strip()
     sort = request.args.get('sort', 'name')
     order = request.args.get('order', 'asc')
-    allowed_sorts = {'name': 'name', 'type': 'type', 'created_at': 'created_at'}
-    sort_col = allowed_sorts.get(sort, 'name')
-    sort_dir = 'DESC' if order == 'desc' else 'ASC'
+    if sort not in LIST_SORTS['company']:
+        sort = 'name'
+    filters = list_filters(['type', 'location'])
+    conditions, args = [], []
     if q:
-        companies = query_db(
-            f'SELECT * FROM companies WHERE name LIKE ? OR type LIKE ? ORDER BY {sort_col} {sort_dir}',
-            (f'%{q}%', f'%{q}%')
-        )
-    else:
-        companies = query_db(f'SELECT * FROM companies ORDER BY {sort_col} {sort_dir}')
-    # Build relationship names for each company
-    company_rels = {}
-    for c in companies:
-        rels = query_db(
-            'SELECT r.from_type, r.from_id, r.to_type, r.to_id FROM relationships r '
-            'WHERE (r.from_type = ? AND r.from_id = ?) OR (r.to_type = ? AND r.to_id = ?)',
-            ('company', c['id'], 'company', c['id'])
-        )
-        names = []
-        for rel in rels:
-            if rel['from_type'] == 'company' and rel['from_id'] == c['id']:
-                other_type, other_id = rel['to_type'], rel['to_id']
-            else:
-                other_type, other_id = rel['from_type'], rel['from_id']
-            other = query_db(f'SELECT name FROM {"companies" if other_type == "company" else "individuals"} WHERE id = ?', (other_id,), one=True)
-            if other:
-                names.append(other['name'])
-        company_rels[c['id']] = names
-    return render_template('company_list.html', companies=companies, company_rels=company_rels, query=q, sort=sort, order=order)
+        conditions.append('(name LIKE ? OR type LIKE ? OR location LIKE ?)')
+        args.extend([f'%{q}%'] * 3)
+    if 'type' in filters:
+        conditions.append('type = ?')
+        args.append(filters['type'])
+    if 'location' in filters:
+        conditions.append('location LIKE ?')
+        args.append(f"%{filters['location']}%")
+    companies, next_cursor = load_list_page('company', sort, order, conditions, args, request.args.get('after'))
+    company_rels = load_relationship_names('company', [c['id'] for c in companies if c['relationship_count']])
+    types = [r['type'] for r in query_db(
+        "SELECT DISTINCT COALESCE(type, '') AS type FROM companies ORDER BY COALESCE(type, '')") if r['type']]
+    list_args = dict(filters, q=q or None, sort=sort, order=order)
+    return render_template('company_list.html', companies=companies, company_rels=company_rels, query=q,
+                           sort=sort, order=order, filters=filters, types=types, list_args=list_args,
+                           next_cursor=next_cursor, paged=bool(request.args.get('after')))
 
 
 # --- Individual List ---
@@ -257,35 +966,23 @@ def individual_list():
     q = request.args.get('q', '').strip()
     sort = request.args.get('sort', 'name')
     order = request.args.get('order', 'asc')
-    allowed_sorts = {'name': 'name', 'title': 'title', 'email': 'email', 'created_at': 'created_at'}
-    sort_col = allowed_sorts.get(sort, 'name')
-    sort_dir = 'DESC' if order == 'desc' else 'ASC'
+    if sort not in LIST_SORTS['individual']:
+        sort = 'name'
+    filters = list_filters(['title', 'location'])
+    conditions, args = [], []
     if q:
-        individuals = query_db(
-            f'SELECT * FROM individuals WHERE name LIKE ? OR title LIKE ? OR email LIKE ? ORDER BY {sort_col} {sort_dir}',
-            (f'%{q}%', f'%{q}%', f'%{q}%')
-        )
-    else:
-        individuals = query_db(f'SELECT * FROM individuals ORDER BY {sort_col} {sort_dir}')
-    # Build relationship names for each individual
-    individual_rels = {}
-    for i in individuals:
-        rels = query_db(
-            'SELECT r.from_type, r.from_id, r.to_type, r.to_id FROM relationships r '
-            'WHERE (r.from_type = ? AND r.from_id = ?) OR (r.to_type = ? AND r.to_id = ?)',
-            ('individual', i['id'], 'individual', i['id'])
-        )
-        names = []
-        for rel in rels:
-            if rel['from_type'] == 'individual' and rel['from_id'] == i['id']:
-                other_type, other_id = rel['to_type'], rel['to_id']
-            else:
-                other_type, other_id = rel['from_type'], rel['from_id']
-            other = query_db(f'SELECT name FROM {"companies" if other_type == "company" else "individuals"} WHERE id = ?', (other_id,), one=True)
-            if other:
-                names.append(other['name'])
-        individual_rels[i['id']] = names
-    return render_template('individual_list.html', individuals=individuals, individual_rels=individual_rels, query=q, sort=sort, order=order)
+        conditions.append('(name LIKE ? OR title LIKE ? OR email LIKE ? OR location LIKE ?)')
+        args.extend([f'%{q}%'] * 4)
+    for field in ('title', 'location'):
+        if field in filters:
+            conditions.append(f'{field} LIKE ?')
+            args.append(f'%{filters[field]}%')
+    individuals, next_cursor = load_list_page('individual', sort, order, conditions, args, request.args.get('after'))
+    individual_rels = load_relationship_names('individual', [i['id'] for i in individuals if i['relationship_count']])
+    list_args = dict(filters, q=q or None, sort=sort, order=order)
+    return render_template('individual_list.html', individuals=individuals, individual_rels=individual_rels, query=q,
+                           sort=sort, order=order, filters=filters, list_args=list_args,
+                           next_cursor=next_cursor, paged=bool(request.args.get('after')))
 
 
 # --- Companies ---
@@ -374,12 +1071,14 @@ def edit_company(id):
 @app.route('/company/<int:id>/delete', methods=['POST'])
 @login_required
 def delete_company(id):
+    related = related_entities([('company', id)])
     query_db('DELETE FROM companies WHERE id = ?', (id,))
     query_db("DELETE FROM notes WHERE entity_type = 'company' AND entity_id = ?", (id,))
     query_db(
         "DELETE FROM relationships WHERE (from_type = 'company' AND from_id = ?) OR (to_type = 'company' AND to_id = ?)",
         (id, id)
     )
+    refresh_counters(related)
     commit_db()
     flash('Company deleted.', 'success')
     return redirect(url_for('index'))
@@ -473,12 +1172,14 @@ def edit_individual(id):
 @app.route('/individual/<int:id>/delete', methods=['POST'])
 @login_required
 def delete_individual(id):
+    related = related_entities([('individual', id)])
     query_db('DELETE FROM individuals WHERE id = ?', (id,))
     query_db("DELETE FROM notes WHERE entity_type = 'individual' AND entity_id = ?", (id,))
     query_db(
         "DELETE FROM relationships WHERE (from_type = 'individual' AND from_id = ?) OR (to_type = 'individual' AND to_id = ?)",
         (id, id)
     )
+    refresh_counters(related)
     commit_db()
     flash('Individual deleted.', 'success')
     return redirect(url_for('index'))
@@ -499,6 +1200,7 @@ def add_note():
             'INSERT INTO notes (entity_type, entity_id, note_text) VALUES (?, ?, ?)',
             (entity_type, entity_id, note_text)
         )
+        refresh_counters([(entity_type, entity_id)])
         commit_db()
         flash('Note added.', 'success')
     if entity_type == 'company':
@@ -512,6 +1214,7 @@ def delete_note(id):
     note = query_db('SELECT * FROM notes WHERE id = ?', (id,), one=True)
     if note:
         query_db('DELETE FROM notes WHERE id = ?', (id,))
+        refresh_counters([(note['entity_type'], note['entity_id'])])
         commit_db()
         flash('Note deleted.', 'success')
         if note['entity_type'] == 'company':
@@ -538,6 +1241,7 @@ def add_relationship():
             'INSERT INTO relationships (from_type, from_id, to_type, to_id, relationship_type) VALUES (?, ?, ?, ?, ?)',
             (from_type, from_id, to_type, to_id, relationship_type)
         )
+        refresh_counters([(from_type, from_id), (to_type, to_id)])
         commit_db()
         flash('Relationship added.', 'success')
     if from_type == 'company':
@@ -551,6 +1255,7 @@ def delete_relationship(id):
     rel = query_db('SELECT * FROM relationships WHERE id = ?', (id,), one=True)
     if rel:
         query_db('DELETE FROM relationships WHERE id = ?', (id,))
+        refresh_counters([(rel['from_type'], rel['from_id']), (rel['to_type'], rel['to_id'])])
         commit_db()
         flash('Relationship deleted.', 'success')
         redirect_type = request.form.get('redirect_type', rel['from_type'])
@@ -562,6 +1267,240 @@ def delete_relationship(id):
     return redirect(url_for('index'))
 
 
+# --- Relationship Graph ---
+
+GRAPH_MAX_DEPTH = int(os.environ.get('GRAPH_MAX_DEPTH', '4'))
+GRAPH_MAX_FANOUT = int(os.environ.get('GRAPH_MAX_FANOUT', '200'))
+GRAPH_MAX_NODES = int(os.environ.get('GRAPH_MAX_NODES', '5000'))
+
+
+def load_entity_names(nodes):
+    """Map (entity_type, id) pairs to names with one query per table chunk."""
+    ids_by_type = {}
+    for entity_type, entity_id in nodes:
+        ids_by_type.setdefault(entity_type, set()).add(entity_id)
+    names = {}
+    for entity_type, ids in ids_by_type.items():
+        table = ENTITY_TABLES.get(entity_type)
+        if not table:
+            continue
+        for batch in chunked(ids):
+            rows = query_db(f'SELECT id, name FROM {table} WHERE id IN ({placeholders(len(batch))})', batch)
+            for row in rows:
+                names[(entity_type, row['id'])] = row['name']
+    return names
+
+
+def graph_neighbors(frontier, fanout):
+    """Return ({node: [(other_node, rel_id, relationship_type), ...]}, capped) for a set of nodes.
+
+    Relationships are treated as undirected edges. Each frontier level costs one
+    indexed query per side, entity type and chunk rather than one per node, and
+    each node keeps at most `fanout` neighbors so hubs can't blow up a traversal.
+    The cap is a per-node LIMIT on the index scan, so a hub costs no more than
+    any other node; `capped` says whether any node had more edges.
+    """
+    ids_by_type = {}
+    for entity_type, entity_id in frontier:
+        ids_by_type.setdefault(entity_type, []).append(entity_id)
+    adjacency = {node: [] for node in frontier}
+    capped = False
+    for entity_type, ids in ids_by_type.items():
+        for batch in chunked(ids):
+            values = ', '.join(['(?)'] * len(batch))
+            for side, other in (('from', 'to'), ('to', 'from')):
+                columns = (f'r.id, r.{other}_type AS other_type, r.{other}_id AS other_id, nodes.node_id, '
+                           f'r.relationship_type')
+                limited = f'{side}_type = ? AND {side}_id = nodes.node_id ORDER BY id LIMIT ?'
+                if USE_POSTGRES:
+                    sql = (f'SELECT {columns} FROM (VALUES {values}) AS nodes (node_id) '
+                           f'CROSS JOIN LATERAL (SELECT * FROM relationships WHERE {limited}) r')
+                else:
+                    # No LATERAL in SQLite; it runs this correlated IN list once per node instead
+                    sql = (f'WITH nodes (node_id) AS (VALUES {values}) SELECT {columns} FROM nodes '
+                           f'JOIN relationships r ON r.id IN (SELECT id FROM relationships WHERE {limited})')
+                # One row past the cap shows whether the node had more edges on this side
+                rows = query_db(sql, batch + [entity_type, fanout + 1])
+                for row in rows:
+                    edges = adjacency[(entity_type, row['node_id'])]
+                    if len(edges) < fanout:
+                        edges.append(((row['other_type'], row['other_id']), row['id'], row['relationship_type']))
+                    else:
+                        capped = True
+    return adjacency, capped
+
+
+def graph_neighborhood(start, depth, fanout, max_nodes=GRAPH_MAX_NODES):
+    """Bounded breadth-first search around `start`; returns ({node: hops}, edges, truncated)."""
+    seen = {start: 0}
+    edges = {}
+    frontier = [start]
+    truncated = False
+    for hop in range(1, depth + 1):
+        if not frontier:
+            break
+        next_frontier = []
+        adjacency, capped = graph_neighbors(frontier, fanout)
+        truncated = truncated or capped
+        for node, neighbors in adjacency.items():
+            for other, rel_id, rel_type in neighbors:
+                if other not in seen:
+                    if len(seen) >= max_nodes:
+                        truncated = True
+                        continue
+                    seen[other] = hop
+                    next_frontier.append(other)
+                if other in seen:
+                    edges[rel_id] = (node, other, rel_type)
+        frontier = next_frontier
+    return seen, list(edges.items()), truncated
+
+
+def graph_shortest_path(start, goal, max_depth, fanout, max_nodes=GRAPH_MAX_NODES):
+    """Bidirectional BFS; returns [(node, rel_id, rel_type), ...] from start to goal, or None.
+
+    The first element carries no relationship; every later element carries the
+    relationship used to reach it from the previous node.
+    """
+    if start == goal:
+        return [(start, None, None)]
+    # parents[node] = (previous node towards the side's origin, rel_id, rel_type)
+    parents = ({start: None}, {goal: None})
+    frontiers = ([start], [goal])
+    hops = 0
+    while frontiers[0] and frontiers[1] and hops < max_depth:
+        # Expand the smaller side first to keep each level cheap
+        side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+        mine, theirs = parents[side], parents[1 - side]
+        next_frontier = []
+        meet = None
+        for node, neighbors in graph_neighbors(frontiers[side], fanout)[0].items():
+            for other, rel_id, rel_type in neighbors:
+                if other in mine:
+                    continue
+                mine[other] = (node, rel_id, rel_type)
+                next_frontier.append(other)
+                if other in theirs:
+                    meet = other
+                    break
+            if meet is not None:
+                break
+        hops += 1
+        if meet is not None:
+            forward, backward = parents
+            path = []
+            node, step = meet, forward[meet]
+            while step is not None:
+                path.append((node, step[1], step[2]))
+                node, step = step[0], forward[step[0]]
+            path.append((start, None, None))
+            path.reverse()
+            node, step = meet, backward[meet]
+            while step is not None:
+                path.append((step[0], step[1], step[2]))
+                node, step = step[0], backward[step[0]]
+            return path
+        if len(mine) + len(theirs) >= max_nodes:
+            return None
+        frontiers = (next_frontier, frontiers[1]) if side == 0 else (frontiers[0], next_frontier)
+    return None
+
+
+def parse_graph_node(value):
+    """Parse 'company:12' / 'individual:7' into a node tuple, or None."""
+    entity_type, _, entity_id = (value or '').partition(':')
+    if entity_type not in ENTITY_TABLES or not entity_id.isdigit():
+        return None
+    return (entity_type, int(entity_id))
+
+
+def graph_limit(name, default, maximum):
+    value = request.args.get(name, type=int)
+    if value is None:
+        return default
+    return max(1, min(value, maximum))
+
+
+@app.route('/api/graph/<entity_type>/<int:id>/neighborhood')
+@login_required
+def graph_neighborhood_api(entity_type, id):
+    if entity_type not in ENTITY_TABLES:
+        return jsonify({'error': 'Invalid entity type'}), 400
+    start = (entity_type, id)
+    depth = graph_limit('depth', 2, GRAPH_MAX_DEPTH)
+    fanout = graph_limit('fanout', GRAPH_MAX_FANOUT, GRAPH_MAX_FANOUT)
+    seen, edges, truncated = graph_neighborhood(start, depth, fanout)
+    names = load_entity_names(seen)
+    if start not in names:
+        return jsonify({'error': 'Entity not found'}), 404
+    return jsonify({
+        'root': {'type': entity_type, 'id': id, 'name': names[start]},
+        'depth': depth,
+        'truncated': truncated,
+        'nodes': [{'type': node[0], 'id': node[1], 'name': names.get(node), 'hops': hops}
+                  for node, hops in sorted(seen.items(), key=lambda item: (item[1], item[0]))],
+        'edges': [{'id': rel_id, 'from': {'type': a[0], 'id': a[1]}, 'to': {'type': b[0], 'id': b[1]},
+                   'relationship_type': rel_type}
+                  for rel_id, (a, b, rel_type) in edges],
+    })
+
+
+@app.route('/api/graph/path')
+@login_required
+def graph_path_api():
+    start = parse_graph_node(request.args.get('from'))
+    goal = parse_graph_node(request.args.get('to'))
+    if not start or not goal:
+        return jsonify({'error': "Use from=<type>:<id>&to=<type>:<id> with type 'company' or 'individual'"}), 400
+    max_depth = graph_limit('max_depth', GRAPH_MAX_DEPTH, GRAPH_MAX_DEPTH)
+    fanout = graph_limit('fanout', GRAPH_MAX_FANOUT, GRAPH_MAX_FANOUT)
+    path = graph_shortest_path(start, goal, max_depth, fanout)
+    if path is None:
+        return jsonify({'found': False, 'max_depth': max_depth, 'path': []})
+    names = load_entity_names(node for node, _, _ in path)
+    return jsonify({
+        'found': True,
+        'hops': len(path) - 1,
+        'path': [{'type': node[0], 'id': node[1], 'name': names.get(node),
+                  'via_relationship_id': rel_id, 'via_relationship_type': rel_type}
+                 for node, rel_id, rel_type in path],
+    })
+
+
+# --- Associations ---
+
+def sync_associations(table, owner_col, owner_id, key_cols, desired):
+    """Make the owner's rows in an association table match `desired`, writing only the difference.
+
+    `desired` is an iterable of key tuples (values for `key_cols`). Stale rows are
+    deleted and missing ones inserted in batches; unchanged rows are left alone.
+    Returns the set of keys that were added or removed.
+    """
+    desired = set(desired)
+    rows = query_db(f'SELECT id, {", ".join(key_cols)} FROM {table} WHERE {owner_col} = ?', (owner_id,))
+    current = {tuple(r[col] for col in key_cols): r['id'] for r in rows}
+    stale = [row_id for key, row_id in current.items() if key not in desired]
+    for batch in chunked(stale):
+        query_db(f'DELETE FROM {table} WHERE id IN ({placeholders(len(batch))})', batch)
+    added = [key for key in desired if key not in current]
+    insert_rows(table, (owner_col,) + tuple(key_cols), [(owner_id,) + key for key in sorted(added)],
+                suffix='ON CONFLICT DO NOTHING')
+    return set(added) | (set(current) - desired)
+
+
+def sync_follow_up_links(follow_up_id, company_ids=(), individual_ids=()):
+    """Sync a follow-up's linked companies/individuals; returns the (entity_type, id) pairs that changed."""
+    desired = [('company', int(i)) for i in company_ids] + [('individual', int(i)) for i in individual_ids]
+    return sync_associations('follow_up_links', 'follow_up_id', follow_up_id,
+                             ('entity_type', 'entity_id'), desired)
+
+
+def sync_proposal_contacts(proposal_id, individual_ids):
+    changed = sync_associations('proposal_contacts', 'proposal_id', proposal_id,
+                                ('individual_id',), [(int(i),) for i in individual_ids])
+    return {individual_id for (individual_id,) in changed}
+
+
 # --- Follow-Ups ---
 
 @app.route('/follow-up/new', methods=['GET'])
@@ -583,14 +1522,10 @@ def add_follow_up():
         return redirect(url_for('index'))
     fu_id = query_db('INSERT INTO follow_ups (title, body, opp_type) VALUES (?, ?, ?) RETURNING id',
                       (title, body, opp_type), insert=True)
-    linked_companies = request.form.getlist('link_companies')
-    for cid in linked_companies:
-        query_db('INSERT INTO follow_up_links (follow_up_id, entity_type, entity_id) VALUES (?, ?, ?)',
-                 (fu_id, 'company', int(cid)))
-    linked_individuals = request.form.getlist('link_individuals')
-    for iid in linked_individuals:
-        query_db('INSERT INTO follow_up_links (follow_up_id, entity_type, entity_id) VALUES (?, ?, ?)',
-                 (fu_id, 'individual', int(iid)))
+    linked = sync_follow_up_links(fu_id, request.form.getlist('link_companies'),
+                                  request.form.getlist('link_individuals'))
+    refresh_counters(linked)
+    publish_follow_up_change(fu_id)
     commit_db()
     flash('Opportunity created.', 'success')
     return redirect(url_for('index'))
@@ -611,14 +1546,10 @@ def edit_follow_up(id):
             return redirect(url_for('edit_follow_up', id=id))
         opp_type = request.form.get('opp_type', 'TBD').strip()
         query_db('UPDATE follow_ups SET title=?, body=?, opp_type=? WHERE id=?', (title, body, opp_type, id))
-        # Replace all links
-        query_db('DELETE FROM follow_up_links WHERE follow_up_id = ?', (id,))
-        for cid in request.form.getlist('link_companies'):
-            query_db('INSERT INTO follow_up_links (follow_up_id, entity_type, entity_id) VALUES (?, ?, ?)',
-                     (id, 'company', int(cid)))
-        for iid in request.form.getlist('link_individuals'):
-            query_db('INSERT INTO follow_up_links (follow_up_id, entity_type, entity_id) VALUES (?, ?, ?)',
-                     (id, 'individual', int(iid)))
+        changed = sync_follow_up_links(id, request.form.getlist('link_companies'),
+                                       request.form.getlist('link_individuals'))
+        refresh_counters(changed)
+        publish_follow_up_change(id)
         commit_db()
         flash('Opportunity updated.', 'success')
         return redirect(url_for('index') + f'#follow-up-{id}')
@@ -638,13 +1569,16 @@ def edit_follow_up(id):
 def add_follow_up_comment(id):
     comment_text = request.form['comment_text'].strip()
     if not comment_text:
+        if partial_format():
+            return jsonify({'error': 'Comment text is required.'}), 400
         flash('Comment text is required.', 'error')
-    else:
-        query_db('INSERT INTO follow_up_comments (follow_up_id, comment_text) VALUES (?, ?)',
-                 (id, comment_text))
-        commit_db()
-        flash('Comment added.', 'success')
-    return redirect(url_for('index') + f'#follow-up-{id}')
+        return redirect(url_for('index') + f'#follow-up-{id}')
+    query_db('INSERT INTO follow_up_comments (follow_up_id, comment_text) VALUES (?, ?)',
+             (id, comment_text))
+    refresh_counters(follow_up_ids=[id])
+    publish_follow_up_change(id)
+    commit_db()
+    return follow_up_action_response(id, 'Comment added.')
 
 
 @app.route('/follow-up/<int:id>/update-body', methods=['POST'])
@@ -652,13 +1586,12 @@ def add_follow_up_comment(id):
 def update_follow_up_body(id):
     fu = query_db('SELECT * FROM follow_ups WHERE id = ?', (id,), one=True)
     if not fu:
-        flash('Opportunity not found.', 'error')
-        return redirect(url_for('index'))
+        return partial_error('Opportunity not found.', 404)
     body = request.form.get('body', '').strip()
     query_db('UPDATE follow_ups SET body = ? WHERE id = ?', (body, id))
+    publish_follow_up_change(id)
     commit_db()
-    flash('Notes updated.', 'success')
-    return redirect(url_for('index') + f'#follow-up-{id}')
+    return follow_up_action_response(id, 'Notes updated.')
 
 
 @app.route('/follow-up/comment/<int:id>/edit', methods=['POST'])
@@ -673,6 +1606,7 @@ def edit_follow_up_comment(id):
         flash('Comment text is required.', 'error')
     else:
         query_db('UPDATE follow_up_comments SET comment_text = ? WHERE id = ?', (comment_text, id))
+        publish_follow_up_change(comment['follow_up_id'])
         commit_db()
         flash('Comment updated.', 'success')
     return redirect(url_for('index') + f'#follow-up-{comment["follow_up_id"]}')
@@ -685,6 +1619,8 @@ def delete_follow_up_comment(id):
     if comment:
         fu_id = comment['follow_up_id']
         query_db('DELETE FROM follow_up_comments WHERE id = ?', (id,))
+        refresh_counters(follow_up_ids=[fu_id])
+        publish_follow_up_change(fu_id)
         commit_db()
         flash('Comment deleted.', 'success')
         return redirect(url_for('index') + f'#follow-up-{fu_id}')
@@ -695,38 +1631,24 @@ def delete_follow_up_comment(id):
 @app.route('/follow-up/<int:id>/delete', methods=['POST'])
 @login_required
 def delete_follow_up(id):
+    linked = follow_up_entities([id])
     query_db('DELETE FROM follow_up_comments WHERE follow_up_id = ?', (id,))
     query_db('DELETE FROM follow_up_links WHERE follow_up_id = ?', (id,))
     query_db('DELETE FROM follow_ups WHERE id = ?', (id,))
+    refresh_counters(linked)
+    publish_follow_up_change(id)
     commit_db()
     flash('Opportunity deleted.', 'success')
     return redirect(url_for('index'))
 
 
 def get_follow_ups_for_entity(entity_type, entity_id):
-    fu_ids = query_db(
-        'SELECT follow_up_id FROM follow_up_links WHERE entity_type = ? AND entity_id = ?',
+    follow_ups = query_db(
+        'SELECT f.* FROM follow_up_links l JOIN follow_ups f ON f.id = l.follow_up_id '
+        'WHERE l.entity_type = ? AND l.entity_id = ? ORDER BY l.id',
         (entity_type, entity_id)
     )
-    result = []
-    for row in fu_ids:
-        fu = query_db('SELECT * FROM follow_ups WHERE id = ?', (row['follow_up_id'],), one=True)
-        if fu:
-            comments = query_db(
-                'SELECT * FROM follow_up_comments WHERE follow_up_id = ? ORDER BY created_at ASC',
-                (fu['id'],)
-            )
-            links = query_db('SELECT * FROM follow_up_links WHERE follow_up_id = ?', (fu['id'],))
-            linked_entities = []
-            for link in links:
-                if link['entity_type'] == 'company':
-                    entity = query_db('SELECT id, name FROM companies WHERE id = ?', (link['entity_id'],), one=True)
-                else:
-                    entity = query_db('SELECT id, name FROM individuals WHERE id = ?', (link['entity_id'],), one=True)
-                if entity:
-                    linked_entities.append({'type': link['entity_type'], 'id': entity['id'], 'name': entity['name']})
-            result.append({'follow_up': fu, 'links': linked_entities, 'comments': comments})
-    return result
+    return load_follow_up_data(follow_ups)
 
 
 # --- Proposals ---
@@ -787,11 +1709,13 @@ def add_proposal():
         monthly_retainer_max = float(monthly_retainer_max) if monthly_retainer_max else None
         status = request.form.get('status', 'Draft')
         date_sent = request.form.get('date_sent', '').strip() or None
+        sent_on = parse_calendar_date(date_sent)
         notes = request.form.get('notes', '').strip() or None
         scope_of_work = request.form.get('scope_of_work', '').strip() or None
         timeline = request.form.get('timeline', '').strip() or None
         contact_person = request.form.get('contact_person', '').strip() or None
         follow_up_date = request.form.get('follow_up_date', '').strip() or None
+        follow_up_on = parse_calendar_date(follow_up_date)
         # Multi-contact: set contact_person from first selected individual
         contact_individuals = request.form.getlist('contact_individuals')
         if contact_individuals and not contact_person:
@@ -799,15 +1723,15 @@ def add_proposal():
             if ind:
                 contact_person = ind['name']
         proposal_id = query_db(
-            'INSERT INTO proposals (name, follow_up_id, onboarding_fee, onboarding_fee_max, monthly_retainer, monthly_retainer_max, status, date_sent, notes, scope_of_work, timeline, contact_person, follow_up_date) '
-            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) RETURNING id',
-            (name, follow_up_id, onboarding_fee, onboarding_fee_max, monthly_retainer, monthly_retainer_max, status, date_sent, notes, scope_of_work, timeline, contact_person, follow_up_date),
+            'INSERT INTO proposals (name, follow_up_id, onboarding_fee, onboarding_fee_max, monthly_retainer, monthly_retainer_max, status, date_sent, notes, scope_of_work, timeline, contact_person, follow_up_date, sent_on, follow_up_on) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) RETURNING id',
+            (name, follow_up_id, onboarding_fee, onboarding_fee_max, monthly_retainer, monthly_retainer_max, status, date_sent, notes, scope_of_work, timeline, contact_person, follow_up_date, sent_on, follow_up_on),
             insert=True
         )
-        # Insert proposal_contacts
-        for iid in contact_individuals:
-            query_db('INSERT INTO proposal_contacts (proposal_id, individual_id) VALUES (?, ?)',
-                     (proposal_id, int(iid)))
+        record_proposal_event(proposal_id, None, status)
+        sync_proposal_contacts(proposal_id, contact_individuals)
+        refresh_counters(follow_up_ids=[follow_up_id])
+        publish_follow_up_change(follow_up_id)
         commit_db()
         flash('Proposal created.', 'success')
         return redirect(url_for('proposals'))
@@ -844,11 +1768,13 @@ def edit_proposal(id):
         monthly_retainer_max = float(monthly_retainer_max) if monthly_retainer_max else None
         status = request.form.get('status', 'Draft')
         date_sent = request.form.get('date_sent', '').strip() or None
+        sent_on = parse_calendar_date(date_sent)
         notes = request.form.get('notes', '').strip() or None
         scope_of_work = request.form.get('scope_of_work', '').strip() or None
         timeline = request.form.get('timeline', '').strip() or None
         contact_person = request.form.get('contact_person', '').strip() or None
         follow_up_date = request.form.get('follow_up_date', '').strip() or None
+        follow_up_on = parse_calendar_date(follow_up_date)
         # Multi-contact: set contact_person from first selected individual
         contact_individuals = request.form.getlist('contact_individuals')
         if contact_individuals and not contact_person:
@@ -856,18 +1782,18 @@ def edit_proposal(id):
             if ind:
                 contact_person = ind['name']
         query_db(
-            'UPDATE proposals SET name=?, follow_up_id=?, onboarding_fee=?, onboarding_fee_max=?, monthly_retainer=?, monthly_retainer_max=?, status=?, date_sent=?, notes=?, scope_of_work=?, timeline=?, contact_person=?, follow_up_date=? WHERE id=?',
-            (name, follow_up_id, onboarding_fee, onboarding_fee_max, monthly_retainer, monthly_retainer_max, status, date_sent, notes, scope_of_work, timeline, contact_person, follow_up_date, id)
+            'UPDATE proposals SET name=?, follow_up_id=?, onboarding_fee=?, onboarding_fee_max=?, monthly_retainer=?, monthly_retainer_max=?, status=?, date_sent=?, notes=?, scope_of_work=?, timeline=?, contact_person=?, follow_up_date=?, sent_on=?, follow_up_on=? WHERE id=?',
+            (name, follow_up_id, onboarding_fee, onboarding_fee_max, monthly_retainer, monthly_retainer_max, status, date_sent, notes, scope_of_work, timeline, contact_person, follow_up_date, sent_on, follow_up_on, id)
         )
-        # Replace proposal_contacts
-        query_db('DELETE FROM proposal_contacts WHERE proposal_id = ?', (id,))
-        for iid in contact_individuals:
-            query_db('INSERT INTO proposal_contacts (proposal_id, individual_id) VALUES (?, ?)',
-                     (id, int(iid)))
+        record_proposal_event(id, proposal['status'], status)
+        sync_proposal_contacts(id, contact_individuals)
         # Auto-close linked opportunity when proposal is Won or Lost
         if status in ('Won', 'Lost') and follow_up_id:
             query_db('UPDATE follow_ups SET closed_at = CURRENT_TIMESTAMP WHERE id = ? AND closed_at IS NULL',
                      (follow_up_id,))
+            refresh_counters(follow_up_entities([follow_up_id]))
+        refresh_counters(follow_up_ids=[proposal['follow_up_id'], follow_up_id])
+        publish_follow_up_change(proposal['follow_up_id'], follow_up_id)
         commit_db()
         flash('Proposal updated.', 'success')
         return redirect(url_for('proposals'))
@@ -880,8 +1806,12 @@ def edit_proposal(id):
 @app.route('/proposal/<int:id>/delete', methods=['POST'])
 @login_required
 def delete_proposal(id):
+    proposal = query_db('SELECT follow_up_id FROM proposals WHERE id = ?', (id,), one=True)
     query_db('DELETE FROM proposal_contacts WHERE proposal_id = ?', (id,))
     query_db('DELETE FROM proposals WHERE id = ?', (id,))
+    if proposal:
+        refresh_counters(follow_up_ids=[proposal['follow_up_id']])
+        publish_follow_up_change(proposal['follow_up_id'])
     commit_db()
     flash('Proposal deleted.', 'success')
     return redirect(url_for('proposals'))
@@ -891,16 +1821,22 @@ def delete_proposal(id):
 @login_required
 def update_proposal_status(id):
     new_status = request.form.get('status')
-    if new_status not in ('Draft', 'Sent', 'Negotiating', 'Won', 'Lost'):
+    if new_status not in PROPOSAL_STATUSES:
         flash('Invalid status.', 'error')
         return redirect(url_for('proposals'))
+    current = query_db('SELECT status, follow_up_id FROM proposals WHERE id = ?', (id,), one=True)
+    if not current:
+        flash('Proposal not found.', 'error')
+        return redirect(url_for('proposals'))
     query_db('UPDATE proposals SET status = ? WHERE id = ?', (new_status, id))
+    record_proposal_event(id, current['status'], new_status)
     # Auto-close linked opportunity when proposal is Won or Lost
-    if new_status in ('Won', 'Lost'):
-        proposal = query_db('SELECT follow_up_id FROM proposals WHERE id = ?', (id,), one=True)
-        if proposal and proposal['follow_up_id']:
-            query_db('UPDATE follow_ups SET closed_at = CURRENT_TIMESTAMP WHERE id = ? AND closed_at IS NULL',
-                     (proposal['follow_up_id'],))
+    if new_status in ('Won', 'Lost') and current['follow_up_id']:
+        query_db('UPDATE follow_ups SET closed_at = CURRENT_TIMESTAMP WHERE id = ? AND closed_at IS NULL',
+                 (current['follow_up_id'],))
+        refresh_counters(follow_up_entities([current['follow_up_id']]))
+    refresh_counters(follow_up_ids=[current['follow_up_id']])
+    publish_follow_up_change(current['follow_up_id'])
     commit_db()
     return redirect(url_for('proposals'))
 
@@ -946,8 +1882,9 @@ def set_priority(id, level):
         # If already at this level, toggle off; otherwise set to the new level
         new_level = 0 if fu['priority_level'] == level else level
         query_db('UPDATE follow_ups SET priority_level = ? WHERE id = ?', (new_level, id))
+        publish_follow_up_change(id)
         commit_db()
-    return redirect(url_for('index') + f'#follow-up-{id}')
+    return follow_up_action_response(id)
 
 
 @app.route('/follow-up/<int:id>/toggle-close', methods=['POST'])
@@ -959,7 +1896,12 @@ def toggle_close_follow_up(id):
             query_db('UPDATE follow_ups SET closed_at = CURRENT_TIMESTAMP WHERE id = ?', (id,))
         else:
             query_db('UPDATE follow_ups SET closed_at = NULL WHERE id = ?', (id,))
+        refresh_counters(follow_up_entities([id]))
+        publish_follow_up_change(id)
         commit_db()
+    fmt = partial_format()
+    if fmt:
+        return follow_up_cards_response(id, fmt)
     return redirect(url_for('index'))
 
 
@@ -970,56 +1912,1054 @@ def convert_to_proposal(id):
     if not fu:
         flash('Opportunity not found.', 'error')
         return redirect(url_for('index'))
+    # Linked individuals become the proposal's contacts; the first one is also contact_person for backward compat
+    contacts = query_db(
+        'SELECT i.id, i.name FROM follow_up_links l JOIN individuals i ON i.id = l.entity_id '
+        "WHERE l.follow_up_id = ? AND l.entity_type = 'individual' ORDER BY l.id", (id,)
+    )
+    contact_person = contacts[0]['name'] if contacts else None
     # Create draft proposal from opportunity
     proposal_id = query_db(
-        'INSERT INTO proposals (name, follow_up_id, status, notes) VALUES (?, ?, ?, ?) RETURNING id',
-        (fu['title'], id, 'Draft', fu['body']),
+        'INSERT INTO proposals (name, follow_up_id, status, notes, contact_person) VALUES (?, ?, ?, ?, ?) RETURNING id',
+        (fu['title'], id, 'Draft', fu['body'], contact_person),
         insert=True
     )
-    # Copy linked individuals to proposal_contacts
-    links = query_db("SELECT entity_id FROM follow_up_links WHERE follow_up_id = ? AND entity_type = 'individual'", (id,))
-    first_contact_name = None
-    for link in links:
-        query_db('INSERT INTO proposal_contacts (proposal_id, individual_id) VALUES (?, ?)',
-                 (proposal_id, link['entity_id']))
-        if first_contact_name is None:
-            ind = query_db('SELECT name FROM individuals WHERE id = ?', (link['entity_id'],), one=True)
-            if ind:
-                first_contact_name = ind['name']
-    # Set contact_person for backward compat
-    if first_contact_name:
-        query_db('UPDATE proposals SET contact_person = ? WHERE id = ?', (first_contact_name, proposal_id))
+    record_proposal_event(proposal_id, None, 'Draft')
+    sync_proposal_contacts(proposal_id, [c['id'] for c in contacts])
+    refresh_counters(follow_up_ids=[id])
+    publish_follow_up_change(id)
     commit_db()
     flash('Proposal created from opportunity.', 'success')
     return redirect(url_for('edit_proposal', id=proposal_id))
 
 
+# --- Due Dates ---
+
+DUE_WINDOW_DAYS = int(os.environ.get('DUE_WINDOW_DAYS', '7'))
+DUE_MAX_DAYS = 90
+DUE_MAX_ITEMS = 200
+# DUE_DIGEST=1 has the job worker queue a digest once a day, after DUE_DIGEST_HOUR in DISPLAY_TIMEZONE
+DUE_DIGEST = os.environ.get('DUE_DIGEST', '') == '1'
+DUE_DIGEST_HOUR = int(os.environ.get('DUE_DIGEST_HOUR', '7'))
+# Every due query is a range scan on idx_proposals_follow_up_on
+DUE_SELECT = (
+    'SELECT p.id, p.name, p.status, p.follow_up_id, p.follow_up_on, f.title AS opportunity_name '
+    'FROM proposals p LEFT JOIN follow_ups f ON f.id = p.follow_up_id '
+    'WHERE p.status IN (' + ', '.join(f"'{status}'" for status in OPEN_PROPOSAL_STATUSES) + ')'
+)
+
+
+def local_today():
+    return datetime.now(DISPLAY_TIMEZONE).date()
+
+
+def backfill_proposal_dates():
+    """Fill sent_on/follow_up_on from the text date columns, rewriting the text as ISO where it parses."""
+    for table in ('proposals', 'archived_proposals'):
+        rows = query_db(f'SELECT id, date_sent, follow_up_date FROM {table} '
+                        f'WHERE (sent_on IS NULL AND date_sent IS NOT NULL) '
+                        f'OR (follow_up_on IS NULL AND follow_up_date IS NOT NULL)')
+        for row in rows:
+            sent_on = parse_calendar_date(row['date_sent'])
+            follow_up_on = parse_calendar_date(row['follow_up_date'])
+            # Unparseable text is kept as typed so nothing is lost; its DATE column stays empty
+            query_db(f'UPDATE {table} SET sent_on = ?, follow_up_on = ?, date_sent = ?, follow_up_date = ? WHERE id = ?',
+                     (sent_on, follow_up_on, sent_on.isoformat() if sent_on else row['date_sent'],
+                      follow_up_on.isoformat() if follow_up_on else row['follow_up_date'], row['id']))
+        if rows:
+            app.logger.info('Normalized dates on %d %s', len(rows), table)
+
+
+def due_proposals(start=None, end=None):
+    """Open proposals with a follow-up date in [start, end] (either end optional), earliest first."""
+    conditions, args = ['p.follow_up_on IS NOT NULL'], []
+    if start:
+        conditions.append('p.follow_up_on >= ?')
+        args.append(start)
+    if end:
+        conditions.append('p.follow_up_on <= ?')
+        args.append(end)
+    return query_db(f'{DUE_SELECT} AND {" AND ".join(conditions)} ORDER BY p.follow_up_on, p.id LIMIT {DUE_MAX_ITEMS}',
+                    args)
+
+
+def due_summary(days=DUE_WINDOW_DAYS, today=None):
+    today = today or local_today()
+    through = today + timedelta(days=days)
+    return {'today': today, 'through': through,
+            'overdue': due_proposals(end=today - timedelta(days=1)), 'due': due_proposals(today, through)}
+
+
+def serialize_due(row, today):
+    follow_up_on = parse_calendar_date(row['follow_up_on'])
+    return {'id': row['id'], 'name': row['name'], 'status': row['status'],
+            'follow_up_id': row['follow_up_id'], 'opportunity_name': row['opportunity_name'],
+            'follow_up_on': follow_up_on.isoformat(), 'days': (follow_up_on - today).days}
+
+
+@app.template_filter('duefmt')
+def duefmt(value):
+    """Render a follow-up date relative to today: 'Today', 'Tomorrow', 'Yesterday' or 'Mar 04'."""
+    value = parse_calendar_date(value)
+    if value is None:
+        return ''
+    days = (value - local_today()).days
+    return {0: 'Today', 1: 'Tomorrow', -1: 'Yesterday'}.get(days, value.strftime('%b %d'))
+
+
+@app.route('/api/due')
+@login_required
+def api_due():
+    """Overdue proposal follow-ups and those due in the next `days` days (default DUE_WINDOW_DAYS)."""
+    days = min(max(request.args.get('days', DUE_WINDOW_DAYS, type=int), 0), DUE_MAX_DAYS)
+    summary = due_summary(days)
+    today = summary['today']
+    return jsonify({
+        'today': today.isoformat(),
+        'through': summary['through'].isoformat(),
+        'overdue': [serialize_due(row, today) for row in summary['overdue']],
+        'due': [serialize_due(row, today) for row in summary['due']],
+    })
+
+
+def schedule_due_digest():
+    """Queue today's due digest if it is past DUE_DIGEST_HOUR and no worker has yet.
+
+    Called from the job worker's housekeeping pass. The scheduled_runs insert
+    decides the race between workers; the previous run's date is handed to the
+    job so each digest only reports what became due since the last one.
+    """
+    now = datetime.now(DISPLAY_TIMEZONE)
+    if not DUE_DIGEST or now.hour < DUE_DIGEST_HOUR:
+        return None
+    today = now.date().isoformat()
+    last = query_db("SELECT MAX(period) AS period FROM scheduled_runs WHERE name = 'due_digest'", one=True)['period']
+    if last == today:
+        return None
+    run_id = query_db("INSERT INTO scheduled_runs (name, period) VALUES ('due_digest', ?) ON CONFLICT DO NOTHING RETURNING id",
+                      (today,), insert=True)
+    if not run_id:
+        commit_db()
+        return None
+    return enqueue_job('due_digest', {'since': last, 'through': today})
+
+
+# --- Activity Timeline ---
+
+def record_proposal_event(proposal_id, from_status, to_status):
+    """Append a proposal status transition and roll it into the funnel; no-op when the status didn't change."""
+    if from_status == to_status:
+        return
+    ts = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+    query_db('INSERT INTO proposal_events (proposal_id, from_status, to_status, created_at) VALUES (?, ?, ?, ?)',
+             (proposal_id, from_status, to_status, ts))
+    apply_funnel_event(proposal_id, from_status, to_status, ts)
+
+
+# Each source is (kind, tiebreak rank, SELECT producing the common event columns,
+# timestamp column, id column, scope filter). Every query is served by a (scope, timestamp) index.
+ACTIVITY_SOURCES = [
+    ('note', 0,
+     "SELECT n.created_at AS ts, n.id AS id, n.note_text AS text, NULL AS detail, NULL AS follow_up_id, NULL AS proposal_id, "
+     "n.entity_type AS entity_type, n.entity_id AS entity_id, COALESCE(c.name, i.name) AS title "
+     "FROM notes n LEFT JOIN companies c ON n.entity_type = 'company' AND c.id = n.entity_id "
+     "LEFT JOIN individuals i ON n.entity_type = 'individual' AND i.id = n.entity_id",
+     'n.created_at', 'n.id', 'entity'),
+    ('comment', 1,
+     "SELECT fc.created_at AS ts, fc.id AS id, fc.comment_text AS text, NULL AS detail, fc.follow_up_id AS follow_up_id, "
+     "NULL AS proposal_id, NULL AS entity_type, NULL AS entity_id, f.title AS title "
+     "FROM follow_up_comments fc JOIN follow_ups f ON f.id = fc.follow_up_id",
+     'fc.created_at', 'fc.id', 'follow_ups'),
+    ('opportunity_created', 2,
+     "SELECT f.created_at AS ts, f.id AS id, f.opp_type AS text, NULL AS detail, f.id AS follow_up_id, NULL AS proposal_id, "
+     "NULL AS entity_type, NULL AS entity_id, f.title AS title FROM follow_ups f",
+     'f.created_at', 'f.id', 'follow_ups'),
+    ('opportunity_closed', 3,
+     "SELECT f.closed_at AS ts, f.id AS id, NULL AS text, NULL AS detail, f.id AS follow_up_id, NULL AS proposal_id, "
+     "NULL AS entity_type, NULL AS entity_id, f.title AS title FROM follow_ups f",
+     'f.closed_at', 'f.id', 'follow_ups'),
+    ('proposal_status', 4,
+     "SELECT pe.created_at AS ts, pe.id AS id, pe.to_status AS text, pe.from_status AS detail, "
+     "p.follow_up_id AS follow_up_id, pe.proposal_id AS proposal_id, NULL AS entity_type, NULL AS entity_id, p.name AS title "
+     "FROM proposal_events pe JOIN proposals p ON p.id = pe.proposal_id",
+     'pe.created_at', 'pe.id', 'proposals'),
+]
+ACTIVITY_PAGE_SIZE = 50
+ACTIVITY_MAX_PAGE_SIZE = 200
+
+
+def to_datetime(value):
+    if isinstance(value, datetime) or value is None:
+        return value
+    return parse_timestamp(str(value))
+
+
+def format_cursor_ts(value):
+    # Matches how CURRENT_TIMESTAMP is stored so SQLite's text comparison lines up
+    return to_db_text(value)
+
+
+def encode_activity_cursor(event):
+    return f"{format_cursor_ts(event['ts'])}|{event['rank']}|{event['id']}"
+
+
+def decode_activity_cursor(value):
+    try:
+        ts, rank, row_id = (value or '').split('|')
+        return (datetime.fromisoformat(ts), int(rank), int(row_id))
+    except ValueError:
+        return None
+
+
+def activity_scope(entity_type, entity_id):
+    """Resolve the follow-ups and proposals whose activity belongs on an entity's timeline."""
+    follow_up_ids = [r['follow_up_id'] for r in query_db(
+        'SELECT follow_up_id FROM follow_up_links WHERE entity_type = ? AND entity_id = ?', (entity_type, entity_id))]
+    proposal_ids = set()
+    for batch in chunked(follow_up_ids):
+        proposal_ids.update(r['id'] for r in query_db(
+            f'SELECT id FROM proposals WHERE follow_up_id IN ({placeholders(len(batch))})', batch))
+    if entity_type == 'individual':
+        proposal_ids.update(r['proposal_id'] for r in query_db(
+            'SELECT proposal_id FROM proposal_contacts WHERE individual_id = ?', (entity_id,)))
+    return {'entity': (entity_type, entity_id), 'follow_ups': follow_up_ids, 'proposals': sorted(proposal_ids)}
+
+
+def load_activity(scope=None, cursor=None, limit=ACTIVITY_PAGE_SIZE):
+    """Return (events, next_cursor) newest first.
+
+    Each source is queried for at most `limit + 1` rows past the cursor, and the
+    sorted results are k-way merged on (timestamp, source rank, id), so a page
+    never reads more than a page's worth from any one table.
+    """
+    streams = []
+    for kind, rank, select, ts_col, id_col, scope_kind in ACTIVITY_SOURCES:
+        where, args = [f'{ts_col} IS NOT NULL'], []
+        if scope is not None:
+            if scope_kind == 'entity':
+                where.append('n.entity_type = ? AND n.entity_id = ?')
+                args.extend(scope['entity'])
+            else:
+                ids = scope[scope_kind]
+                if not ids:
+                    continue
+                column = 'f.id' if kind.startswith('opportunity') else (
+                    'fc.follow_up_id' if kind == 'comment' else 'pe.proposal_id')
+                where.append(f'{column} IN ({placeholders(len(ids))})')
+                args.extend(ids)
+        if cursor is not None:
+            ts, cursor_rank, cursor_id = cursor
+            ts = format_cursor_ts(ts)
+            if rank < cursor_rank:
+                where.append(f'{ts_col} <= ?')
+                args.append(ts)
+            elif rank == cursor_rank:
+                where.append(f'({ts_col} < ? OR ({ts_col} = ? AND {id_col} < ?))')
+                args.extend([ts, ts, cursor_id])
+            else:
+                where.append(f'{ts_col} < ?')
+                args.append(ts)
+        rows = query_db(f'{select} WHERE {" AND ".join(where)} ORDER BY {ts_col} DESC, {id_col} DESC LIMIT ?',
+                        args + [limit + 1])
+        events = []
+        for row in rows:
+            event = dict(row, kind=kind, rank=rank, ts=to_datetime(row['ts']))
+            if event['ts'] is not None:
+                events.append(event)
+        streams.append(events)
+    merged = list(itertools.islice(
+        heapq.merge(*streams, key=lambda e: (e['ts'], e['rank'], e['id']), reverse=True), limit + 1))
+    next_cursor = encode_activity_cursor(merged[limit - 1]) if len(merged) > limit else None
+    return merged[:limit], next_cursor
+
+
+def activity_request(entity_type=None, entity_id=None):
+    limit = max(1, min(request.args.get('limit', ACTIVITY_PAGE_SIZE, type=int), ACTIVITY_MAX_PAGE_SIZE))
+    cursor = decode_activity_cursor(request.args.get('cursor'))
+    scope = activity_scope(entity_type, entity_id) if entity_type else None
+    return load_activity(scope, cursor, limit)
+
+
+def load_activity_entity(entity_type, entity_id):
+    if entity_type not in ENTITY_TABLES:
+        return None
+    return query_db(f'SELECT id, name FROM {ENTITY_TABLES[entity_type]} WHERE id = ?', (entity_id,), one=True)
+
+
+@app.route('/activity')
+@app.route('/activity/<entity_type>/<int:id>')
+@login_required
+def activity(entity_type=None, id=None):
+    entity = None
+    if entity_type:
+        entity = load_activity_entity(entity_type, id)
+        if not entity:
+            flash('Not found.', 'error')
+            return redirect(url_for('index'))
+    events, next_cursor = activity_request(entity_type, id)
+    return render_template('activity.html', events=events, next_cursor=next_cursor,
+                           entity=entity, entity_type=entity_type)
+
+
+@app.route('/api/activity')
+@app.route('/api/activity/<entity_type>/<int:id>')
+@login_required
+def activity_api(entity_type=None, id=None):
+    if entity_type and not load_activity_entity(entity_type, id):
+        return jsonify({'error': 'Not found'}), 404
+    events, next_cursor = activity_request(entity_type, id)
+    return jsonify({'events': [serialize_row({k: v for k, v in e.items() if k != 'rank'}) for e in events],
+                    'next_cursor': next_cursor})
+
+
+# --- Proposal Funnel ---
+
+FUNNEL_STAGES = ('Draft', 'Sent', 'Negotiating', 'Won')
+FUNNEL_MAX_DAYS = 365
+FUNNEL_DEFAULT_MONTHS = 12
+
+
+def funnel_step(state, from_status, to_status, ts):
+    """Advance one proposal's funnel state by a status event.
+
+    `state` is the proposal's proposal_funnel row as a dict, or None the first
+    time it's seen. Returns (state, reached, stage_days): the new state, the
+    (cohort_month, stage) pairs the proposal reached for the first time, and
+    (month, stage, days) for the stage it just left, if its entry time is known.
+    Reaching a stage counts every earlier FUNNEL_STAGES stage as reached too.
+    """
+    if state is None:
+        # Proposals older than the event history first show up mid-funnel, with an unknown entry time
+        state = {'cohort_month': ts.strftime('%Y-%m'), 'max_rank': -1, 'lost': 0,
+                 'stage': from_status, 'stage_entered_at': None}
+        entering = [from_status, to_status]
+    else:
+        state = dict(state)
+        entering = [to_status]
+    reached = []
+    for status in entering:
+        if status == 'Lost' and not state['lost']:
+            state['lost'] = 1
+            reached.append('Lost')
+        elif status in FUNNEL_STAGES:
+            rank = FUNNEL_STAGES.index(status)
+            reached.extend(FUNNEL_STAGES[state['max_rank'] + 1:rank + 1])
+            state['max_rank'] = max(state['max_rank'], rank)
+    stage_days = None
+    entered_at = to_datetime(state['stage_entered_at'])
+    if state['stage'] and entered_at is not None:
+        days = min(max((ts - entered_at).days, 0), FUNNEL_MAX_DAYS)
+        stage_days = (ts.strftime('%Y-%m'), state['stage'], days)
+    state.update(stage=to_status, stage_entered_at=ts)
+    return state, [(state['cohort_month'], stage) for stage in reached], stage_days
+
+
+FUNNEL_REACHED_UPSERT = (
+    'INSERT INTO funnel_reached (cohort_month, stage, proposals) VALUES (?, ?, ?) '
+    'ON CONFLICT (cohort_month, stage) DO UPDATE SET proposals = funnel_reached.proposals + excluded.proposals'
+)
+FUNNEL_DAYS_UPSERT = (
+    'INSERT INTO funnel_stage_days (month, stage, days, proposals) VALUES (?, ?, ?, ?) '
+    'ON CONFLICT (month, stage, days) DO UPDATE SET proposals = funnel_stage_days.proposals + excluded.proposals'
+)
+
+
+def apply_funnel_event(proposal_id, from_status, to_status, ts):
+    """Fold one status event into the funnel rollups with a handful of keyed writes."""
+    row = query_db('SELECT * FROM proposal_funnel WHERE proposal_id = ?', (proposal_id,), one=True)
+    state, reached, stage_days = funnel_step(dict(row) if row else None, from_status, to_status, ts)
+    values = (state['max_rank'], state['lost'], state['stage'], state['stage_entered_at'], proposal_id)
+    if row:
+        query_db('UPDATE proposal_funnel SET max_rank = ?, lost = ?, stage = ?, stage_entered_at = ? '
+                 'WHERE proposal_id = ?', values)
+    else:
+        query_db('INSERT INTO proposal_funnel (max_rank, lost, stage, stage_entered_at, proposal_id, cohort_month) '
+                 'VALUES (?, ?, ?, ?, ?, ?)', values + (state['cohort_month'],))
+    for cohort_month, stage in reached:
+        query_db(FUNNEL_REACHED_UPSERT, (cohort_month, stage, 1))
+    if stage_days:
+        query_db(FUNNEL_DAYS_UPSERT, stage_days + (1,))
+
+
+def rebuild_funnel():
+    """Recompute the funnel rollups by replaying proposal_events in order."""
+    states, reached_counts, day_counts = {}, {}, {}
+    for event in iter_query('SELECT proposal_id, from_status, to_status, created_at FROM proposal_events '
+                            'ORDER BY created_at, id'):
+        ts = to_datetime(event['created_at'])
+        if ts is None:
+            continue
+        state, reached, stage_days = funnel_step(states.get(event['proposal_id']), event['from_status'],
+                                                 event['to_status'], ts)
+        states[event['proposal_id']] = state
+        for key in reached:
+            reached_counts[key] = reached_counts.get(key, 0) + 1
+        if stage_days:
+            day_counts[stage_days] = day_counts.get(stage_days, 0) + 1
+    for table in ('proposal_funnel', 'funnel_reached', 'funnel_stage_days'):
+        query_db(f'DELETE FROM {table}')
+    insert_rows('proposal_funnel', ('proposal_id', 'cohort_month', 'max_rank', 'lost', 'stage', 'stage_entered_at'),
+                [(pid, s['cohort_month'], s['max_rank'], s['lost'], s['stage'], s['stage_entered_at'])
+                 for pid, s in states.items()])
+    insert_rows('funnel_reached', ('cohort_month', 'stage', 'proposals'),
+                [key + (n,) for key, n in reached_counts.items()])
+    insert_rows('funnel_stage_days', ('month', 'stage', 'days', 'proposals'),
+                [key + (n,) for key, n in day_counts.items()])
+    return len(states)
+
+
+def histogram_median(counts):
+    """Median of a {value: count} histogram, or None if it's empty."""
+    total = sum(counts.values())
+    if not total:
+        return None
+    seen = 0
+    for value in sorted(counts):
+        seen += counts[value]
+        if seen * 2 >= total:
+            return value
+
+
+def funnel_summary(reached, days):
+    """Conversion rates and median days in stage from reached counts and day histograms."""
+    pairs = list(zip(FUNNEL_STAGES, FUNNEL_STAGES[1:])) + [(FUNNEL_STAGES[0], FUNNEL_STAGES[-1])]
+    return {
+        'reached': {stage: reached.get(stage, 0) for stage in FUNNEL_STAGES + ('Lost',)},
+        'conversion': {f'{a}->{b}': round(reached.get(b, 0) / reached[a], 4) if reached.get(a) else None
+                       for a, b in pairs},
+        'median_days_in_stage': {stage: histogram_median(days.get(stage, {})) for stage in FUNNEL_STAGES},
+    }
+
+
+@app.route('/api/funnel')
+@login_required
+def api_funnel():
+    """Funnel by month from the rollup tables; cost depends on months requested, not on history size.
+
+    Conversion is by cohort (the month a proposal first appeared); median days
+    in stage is by the month the stage was left, in whole days capped at
+    FUNNEL_MAX_DAYS.
+    """
+    months = min(max(request.args.get('months', FUNNEL_DEFAULT_MONTHS, type=int), 1), 120)
+    today = datetime.now(timezone.utc)
+    first = today.year * 12 + today.month - months
+    since = f'{first // 12:04d}-{first % 12 + 1:02d}'
+    reached, days = {}, {}
+    for row in query_db('SELECT cohort_month, stage, proposals FROM funnel_reached WHERE cohort_month >= ?', (since,)):
+        reached.setdefault(row['cohort_month'], {})[row['stage']] = row['proposals']
+    for row in query_db('SELECT month, stage, days, proposals FROM funnel_stage_days WHERE month >= ?', (since,)):
+        days.setdefault(row['month'], {}).setdefault(row['stage'], {})[row['days']] = row['proposals']
+    total_reached, total_days = {}, {}
+    for counts in reached.values():
+        for stage, n in counts.items():
+            total_reached[stage] = total_reached.get(stage, 0) + n
+    for stages in days.values():
+        for stage, histogram in stages.items():
+            for value, n in histogram.items():
+                total_days.setdefault(stage, {})[value] = total_days.get(stage, {}).get(value, 0) + n
+    return jsonify({
+        'since': since,
+        'stages': list(FUNNEL_STAGES),
+        'months': [dict(funnel_summary(reached.get(month, {}), days.get(month, {})), month=month)
+                   for month in sorted(set(reached) | set(days))],
+        'total': funnel_summary(total_reached, total_days),
+    })
+
+
+@app.cli.command('rebuild-funnel')
+def rebuild_funnel_command():
+    """Recompute the proposal funnel rollups from proposal_events."""
+    create_app()
+    proposals = rebuild_funnel()
+    commit_db()
+    click.echo(f'Funnel rebuilt from the history of {proposals} proposals.')
+
+
+# --- Archive ---
+
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', '180'))
+ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', '200'))
+ARCHIVE_PAGE_SIZE = 100
+# Columns each archived_ table copies from its hot twin; follow-up counter caches stay behind
+ARCHIVE_COLUMNS = {
+    'follow_ups': ('id', 'title', 'body', 'opp_type', 'closed_at', 'sort_order', 'priority_level', 'priority_order',
+                   'created_at'),
+    'follow_up_links': ('id', 'follow_up_id', 'entity_type', 'entity_id'),
+    'follow_up_comments': ('id', 'follow_up_id', 'comment_text', 'created_at'),
+    'proposals': ('id', 'name', 'follow_up_id', 'onboarding_fee', 'onboarding_fee_max', 'monthly_retainer',
+                  'monthly_retainer_max', 'status', 'date_sent', 'notes', 'scope_of_work', 'timeline',
+                  'contact_person', 'follow_up_date', 'sent_on', 'follow_up_on', 'sort_order', 'created_at'),
+    'proposal_contacts': ('id', 'proposal_id', 'individual_id'),
+}
+# A Won/Lost proposal counts as finished from its last move into that status (or its creation, without history)
+ARCHIVABLE_PROPOSALS = (
+    "SELECT p.id FROM proposals p WHERE p.status IN ('Won', 'Lost') AND COALESCE("
+    "(SELECT MAX(e.created_at) FROM proposal_events e WHERE e.proposal_id = p.id AND e.to_status = p.status), "
+    "p.created_at) < ? ORDER BY p.id LIMIT ?"
+)
+# Closed follow-ups wait until none of their proposals are left in the hot tables
+ARCHIVABLE_FOLLOW_UPS = (
+    'SELECT f.id FROM follow_ups f WHERE f.closed_at < ? '
+    'AND NOT EXISTS (SELECT 1 FROM proposals p WHERE p.follow_up_id = f.id) ORDER BY f.closed_at, f.id LIMIT ?'
+)
+
+
+def move_rows(table, key, ids, restore=False):
+    """Move the rows of `table` whose `key` is in `ids` to its archived_ twin, or back with `restore`."""
+    source, target = (f'archived_{table}', table) if restore else (table, f'archived_{table}')
+    columns = ', '.join(ARCHIVE_COLUMNS[table])
+    # A merge can leave repeats of an archived link or contact; the hot unique index keeps one
+    suffix = ' ON CONFLICT DO NOTHING' if restore and table in ('follow_up_links', 'proposal_contacts') else ''
+    for batch in chunked(ids):
+        marks = placeholders(len(batch))
+        query_db(f'INSERT INTO {target} ({columns}) SELECT {columns} FROM {source} WHERE {key} IN ({marks}){suffix}',
+                 batch)
+        query_db(f'DELETE FROM {source} WHERE {key} IN ({marks})', batch)
+
+
+def archive_proposals(ids):
+    follow_up_ids = set()
+    for batch in chunked(ids):
+        rows = query_db(f'SELECT follow_up_id FROM proposals WHERE id IN ({placeholders(len(batch))})', batch)
+        follow_up_ids.update(r['follow_up_id'] for r in rows)
+    move_rows('proposal_contacts', 'proposal_id', ids)
+    move_rows('proposals', 'id', ids)
+    refresh_counters(follow_up_ids=follow_up_ids)
+
+
+def archive_follow_ups(ids):
+    # Closed follow-ups aren't in any entity's open_follow_up_count, so no counters change
+    move_rows('follow_up_comments', 'follow_up_id', ids)
+    move_rows('follow_up_links', 'follow_up_id', ids)
+    move_rows('follow_ups', 'id', ids)
+
+
+def archive_closed(days=ARCHIVE_AFTER_DAYS, batch_size=ARCHIVE_BATCH_SIZE, progress=None):
+    """Move proposals finished and follow-ups closed more than `days` ago into the archive tables.
+
+    Proposals go first so their follow-ups qualify in the same run. Every batch
+    commits on its own to keep transactions short; a record and its child rows
+    always move together.
+    """
+    cutoff = db_timestamp(datetime.now(timezone.utc) - timedelta(days=days))
+    moved = {'proposals': 0, 'follow_ups': 0}
+    for kind, select, archive_batch in [('proposals', ARCHIVABLE_PROPOSALS, archive_proposals),
+                                        ('follow_ups', ARCHIVABLE_FOLLOW_UPS, archive_follow_ups)]:
+        while True:
+            ids = [r['id'] for r in query_db(select, (cutoff, batch_size))]
+            if not ids:
+                break
+            archive_batch(ids)
+            commit_db()
+            moved[kind] += len(ids)
+            if progress:
+                progress(moved)
+    return moved
+
+
+def restore_follow_up(id):
+    """Move an archived follow-up with its comments and links back to the hot tables."""
+    move_rows('follow_ups', 'id', [id], restore=True)
+    move_rows('follow_up_links', 'follow_up_id', [id], restore=True)
+    move_rows('follow_up_comments', 'follow_up_id', [id], restore=True)
+    refresh_counters(follow_up_entities([id]), follow_up_ids=[id])
+
+
+def restore_proposal(id):
+    """Move an archived proposal and its contacts back, bringing its follow-up along if that was archived too."""
+    proposal = query_db('SELECT follow_up_id FROM archived_proposals WHERE id = ?', (id,), one=True)
+    follow_up_id = proposal['follow_up_id']
+    if follow_up_id and query_db('SELECT 1 FROM archived_follow_ups WHERE id = ?', (follow_up_id,), one=True):
+        restore_follow_up(follow_up_id)
+    move_rows('proposals', 'id', [id], restore=True)
+    move_rows('proposal_contacts', 'proposal_id', [id], restore=True)
+    refresh_counters(follow_up_ids=[follow_up_id])
+
+
+@app.route('/archive')
+@login_required
+def archive():
+    q = request.args.get('q', '').strip()
+    follow_up_filter = proposal_filter = ''
+    args = ()
+    if q:
+        follow_up_filter = 'WHERE title LIKE ? OR body LIKE ?'
+        proposal_filter = 'WHERE name LIKE ? OR notes LIKE ?'
+        args = (f'%{q}%', f'%{q}%')
+    follow_ups = query_db(f'SELECT * FROM archived_follow_ups {follow_up_filter} '
+                          f'ORDER BY closed_at DESC, id DESC LIMIT {ARCHIVE_PAGE_SIZE}', args)
+    proposals = query_db(f'SELECT * FROM archived_proposals {proposal_filter} '
+                         f'ORDER BY archived_at DESC, id DESC LIMIT {ARCHIVE_PAGE_SIZE}', args)
+    return render_template('archive.html', query=q, follow_ups=follow_ups, proposals=proposals,
+                           page_size=ARCHIVE_PAGE_SIZE, archive_after_days=ARCHIVE_AFTER_DAYS)
+
+
+@app.route('/archive/follow-up/<int:id>')
+@login_required
+def archived_follow_up(id):
+    fu = query_db('SELECT * FROM archived_follow_ups WHERE id = ?', (id,), one=True)
+    if not fu:
+        flash('Archived opportunity not found.', 'error')
+        return redirect(url_for('archive'))
+    links = query_db(
+        "SELECT l.entity_type, COALESCE(c.id, i.id) AS id, COALESCE(c.name, i.name) AS name "
+        "FROM archived_follow_up_links l "
+        "LEFT JOIN companies c ON l.entity_type = 'company' AND c.id = l.entity_id "
+        "LEFT JOIN individuals i ON l.entity_type = 'individual' AND i.id = l.entity_id "
+        "WHERE l.follow_up_id = ? ORDER BY l.id", (id,)
+    )
+    comments = query_db('SELECT * FROM archived_follow_up_comments WHERE follow_up_id = ? ORDER BY created_at, id', (id,))
+    proposals = query_db('SELECT id, name, status FROM archived_proposals WHERE follow_up_id = ? ORDER BY id', (id,))
+    return render_template('archived_follow_up.html', fu=fu, links=[l for l in links if l['id'] is not None],
+                           comments=comments, proposals=proposals)
+
+
+@app.route('/archive/follow-up/<int:id>/restore', methods=['POST'])
+@login_required
+def restore_archived_follow_up(id):
+    if not query_db('SELECT 1 FROM archived_follow_ups WHERE id = ?', (id,), one=True):
+        flash('Archived opportunity not found.', 'error')
+        return redirect(url_for('archive'))
+    restore_follow_up(id)
+    publish_follow_up_change(id)
+    commit_db()
+    flash('Opportunity restored. Reopen it to keep it out of the next archive run.', 'success')
+    return redirect(url_for('index', _anchor=f'follow-up-{id}'))
+
+
+@app.route('/archive/proposal/<int:id>')
+@login_required
+def archived_proposal(id):
+    proposal = query_db('SELECT * FROM archived_proposals WHERE id = ?', (id,), one=True)
+    if not proposal:
+        flash('Archived proposal not found.', 'error')
+        return redirect(url_for('archive'))
+    opportunity = None
+    if proposal['follow_up_id']:
+        opportunity = query_db(
+            'SELECT id, title, 0 AS archived FROM follow_ups WHERE id = ? '
+            'UNION ALL SELECT id, title, 1 FROM archived_follow_ups WHERE id = ?',
+            (proposal['follow_up_id'], proposal['follow_up_id']), one=True
+        )
+    contacts = query_db(
+        'SELECT i.id, i.name FROM archived_proposal_contacts pc JOIN individuals i ON pc.individual_id = i.id '
+        'WHERE pc.proposal_id = ? ORDER BY pc.id', (id,)
+    )
+    return render_template('archived_proposal.html', proposal=proposal, opportunity=opportunity, contacts=contacts)
+
+
+@app.route('/archive/proposal/<int:id>/restore', methods=['POST'])
+@login_required
+def restore_archived_proposal(id):
+    proposal = query_db('SELECT follow_up_id FROM archived_proposals WHERE id = ?', (id,), one=True)
+    if not proposal:
+        flash('Archived proposal not found.', 'error')
+        return redirect(url_for('archive'))
+    restore_proposal(id)
+    if proposal['follow_up_id']:
+        publish_follow_up_change(proposal['follow_up_id'])
+    commit_db()
+    flash('Proposal restored. Change its status to keep it out of the next archive run.', 'success')
+    return redirect(url_for('edit_proposal', id=id))
+
+
+@app.cli.command('archive')
+@click.option('--days', default=ARCHIVE_AFTER_DAYS, show_default=True,
+              help='Archive records closed or finished more than this many days ago.')
+def archive_command(days):
+    """Move old closed opportunities and finished proposals into the archive tables."""
+    create_app()
+    moved = archive_closed(days)
+    click.echo(f"Archived {moved['proposals']} proposals and {moved['follow_ups']} opportunities.")
+
+
+# --- Duplicates ---
+
+DEDUPE_NAME_THRESHOLD = float(os.environ.get('DEDUPE_NAME_THRESHOLD', '0.88'))
+# Members of a name block are only compared with their nearest neighbors in sorted order
+DEDUPE_WINDOW = 8
+# Groups bigger than this are almost always a shared address (info@, a parent company page)
+DEDUPE_MAX_GROUP = 25
+COMPANY_SUFFIXES = {'inc', 'incorporated', 'llc', 'ltd', 'limited', 'co', 'corp', 'corporation', 'company', 'plc', 'gmbh'}
+MERGE_FIELDS = {
+    'company': ['website', 'type', 'linkedin_url', 'location'],
+    'individual': ['title', 'email', 'phone', 'linkedin_url', 'location'],
+}
+
+
+def normalize_email(value):
+    return (value or '').strip().lower()
+
+
+def normalize_url(value):
+    """Reduce a LinkedIn/website URL to host + path so scheme, www and trailing slashes don't matter."""
+    value = (value or '').strip().lower()
+    value = re.sub(r'^[a-z]+://', '', value)
+    value = re.sub(r'^www\.', '', value)
+    return value.split('?')[0].split('#')[0].rstrip('/')
+
+
+def name_tokens(value, entity_type):
+    tokens = re.sub(r'[^\w\s]', ' ', (value or '').lower()).split()
+    if entity_type == 'company':
+        tokens = [t for t in tokens if t not in COMPANY_SUFFIXES] or tokens
+    return tokens
+
+
+class DisjointSet:
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, item):
+        parent = self.parent.setdefault(item, item)
+        if parent != item:
+            parent = self.parent[item] = self.find(parent)
+        return parent
+
+    def union(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            # Keep the oldest (smallest) id as the root
+            if root_b < root_a:
+                root_a, root_b = root_b, root_a
+            self.parent[root_b] = root_a
+
+
+def find_duplicate_groups(entity_type, progress=None):
+    """Return {group_id: {entity_id: score}} of likely duplicates.
+
+    Rows are streamed once and bucketed by blocking keys (email, LinkedIn URL,
+    website, and first initial + last name token), so only rows sharing a key
+    are ever compared. Name blocks are scored with a sorted-neighborhood window,
+    which keeps the work linear even when a block is large.
+    """
+    table = ENTITY_TABLES[entity_type]
+    contact_col = 'email' if entity_type == 'individual' else 'website'
+    exact_blocks = {}
+    name_blocks = {}
+    names = {}
+    contacts = {}
+    for count, row in enumerate(iter_query(f'SELECT id, name, {contact_col}, linkedin_url FROM {table}'), 1):
+        entity_id = row['id']
+        tokens = name_tokens(row['name'], entity_type)
+        contact = normalize_email(row[contact_col]) if entity_type == 'individual' else normalize_url(row[contact_col])
+        linkedin = normalize_url(row['linkedin_url'])
+        if contact:
+            contacts[entity_id] = contact
+            exact_blocks.setdefault(('contact', contact), []).append(entity_id)
+        if linkedin:
+            exact_blocks.setdefault(('linkedin', linkedin), []).append(entity_id)
+        if tokens:
+            names[entity_id] = ' '.join(sorted(tokens))
+            name_blocks.setdefault(tokens[0][0] + '|' + tokens[-1], []).append(entity_id)
+        if progress and count % 50000 == 0:
+            progress(count)
+
+    groups = DisjointSet()
+    scores = {}
+
+    def link(a, b, score):
+        groups.union(a, b)
+        scores[a] = max(scores.get(a, 0), score)
+        scores[b] = max(scores.get(b, 0), score)
+
+    for members in exact_blocks.values():
+        if 1 < len(members) <= DEDUPE_MAX_GROUP:
+            for other in members[1:]:
+                link(members[0], other, 1.0)
+    for members in name_blocks.values():
+        if len(members) < 2:
+            continue
+        members.sort(key=names.__getitem__)
+        for i, a in enumerate(members):
+            for b in members[i + 1:i + DEDUPE_WINDOW]:
+                if a in contacts and b in contacts and contacts[a] != contacts[b]:
+                    continue
+                matcher = SequenceMatcher(None, names[a], names[b])
+                if matcher.quick_ratio() < DEDUPE_NAME_THRESHOLD:
+                    continue
+                score = matcher.ratio()
+                if score >= DEDUPE_NAME_THRESHOLD:
+                    link(a, b, round(score, 3))
+
+    result = {}
+    for entity_id, score in scores.items():
+        result.setdefault(groups.find(entity_id), {})[entity_id] = score
+    return {group_id: members for group_id, members in result.items() if len(members) <= DEDUPE_MAX_GROUP}
+
+
+def refresh_duplicate_candidates(entity_type, progress=None):
+    """Rescan one entity type and replace its stored merge suggestions."""
+    groups = find_duplicate_groups(entity_type, progress)
+    query_db('DELETE FROM duplicate_candidates WHERE entity_type = ?', (entity_type,))
+    insert_rows('duplicate_candidates', ('entity_type', 'group_id', 'entity_id', 'score'),
+                [(entity_type, group_id, entity_id, score)
+                 for group_id, members in groups.items() for entity_id, score in members.items()])
+    commit_db()
+    return len(groups)
+
+
+def merge_entities(entity_type, keep_id, merge_ids):
+    """Fold `merge_ids` into `keep_id` in a single transaction."""
+    table = ENTITY_TABLES[entity_type]
+    merge_ids = [i for i in merge_ids if i != keep_id]
+    keep = query_db(f'SELECT * FROM {table} WHERE id = ?', (keep_id,), one=True)
+    if not keep or not merge_ids:
+        return 0
+    marks = placeholders(len(merge_ids))
+    dups = query_db(f'SELECT * FROM {table} WHERE id IN ({marks}) ORDER BY id', merge_ids)
+    merge_ids = [d['id'] for d in dups]
+    if not merge_ids:
+        return 0
+    marks = placeholders(len(merge_ids))
+    try:
+        # Fill blank fields on the surviving row from the duplicates
+        updates = {}
+        for field in MERGE_FIELDS[entity_type]:
+            if not keep[field]:
+                value = next((d[field] for d in dups if d[field]), None)
+                if value:
+                    updates[field] = value
+        if updates:
+            query_db(f'UPDATE {table} SET {", ".join(f"{k} = ?" for k in updates)} WHERE id = ?',
+                     list(updates.values()) + [keep_id])
+        for side in ('from', 'to'):
+            query_db(f'UPDATE relationships SET {side}_id = ? WHERE {side}_type = ? AND {side}_id IN ({marks})',
+                     [keep_id, entity_type] + merge_ids)
+        query_db(f'UPDATE notes SET entity_id = ? WHERE entity_type = ? AND entity_id IN ({marks})',
+                 [keep_id, entity_type] + merge_ids)
+        # Links and contacts are unique per owner, so drop the rows that would collide before repointing
+        all_marks = placeholders(len(merge_ids) + 1)
+        all_ids = [keep_id] + merge_ids
+        query_db(f'DELETE FROM follow_up_links WHERE entity_type = ? AND entity_id IN ({all_marks}) AND id NOT IN '
+                 f'(SELECT MIN(id) FROM follow_up_links WHERE entity_type = ? AND entity_id IN ({all_marks}) '
+                 f'GROUP BY follow_up_id)',
+                 [entity_type] + all_ids + [entity_type] + all_ids)
+        query_db(f'UPDATE follow_up_links SET entity_id = ? WHERE entity_type = ? AND entity_id IN ({marks})',
+                 [keep_id, entity_type] + merge_ids)
+        if entity_type == 'individual':
+            query_db(f'DELETE FROM proposal_contacts WHERE individual_id IN ({all_marks}) AND id NOT IN '
+                     f'(SELECT MIN(id) FROM proposal_contacts WHERE individual_id IN ({all_marks}) GROUP BY proposal_id)',
+                     all_ids + all_ids)
+            query_db(f'UPDATE proposal_contacts SET individual_id = ? WHERE individual_id IN ({marks})',
+                     [keep_id] + merge_ids)
+            query_db(f'UPDATE archived_proposal_contacts SET individual_id = ? WHERE individual_id IN ({marks})',
+                     [keep_id] + merge_ids)
+        # Archived rows aren't unique per owner; restoring them skips any repeats this leaves
+        query_db(f'UPDATE archived_follow_up_links SET entity_id = ? WHERE entity_type = ? AND entity_id IN ({marks})',
+                 [keep_id, entity_type] + merge_ids)
+        # Drop relationships the repointing turned into self-links or exact repeats
+        query_db('DELETE FROM relationships WHERE from_type = ? AND from_id = ? AND to_type = ? AND to_id = ?',
+                 (entity_type, keep_id, entity_type, keep_id))
+        touches_keep = '((from_type = ? AND from_id = ?) OR (to_type = ? AND to_id = ?))'
+        query_db(f'DELETE FROM relationships WHERE {touches_keep} AND id NOT IN '
+                 f'(SELECT MIN(id) FROM relationships WHERE {touches_keep} '
+                 f'GROUP BY from_type, from_id, to_type, to_id, relationship_type)',
+                 (entity_type, keep_id) * 4)
+        query_db(f'DELETE FROM {table} WHERE id IN ({marks})', merge_ids)
+        query_db(f'DELETE FROM duplicate_candidates WHERE entity_type = ? AND group_id IN '
+                 f'(SELECT group_id FROM duplicate_candidates WHERE entity_type = ? AND entity_id IN ({placeholders(len(merge_ids) + 1)}))',
+                 [entity_type, entity_type, keep_id] + merge_ids)
+        # Neighbors can lose relationships that became repeats of one they already had with keep
+        keep_node = (entity_type, keep_id)
+        refresh_counters({keep_node} | related_entities([keep_node]))
+        commit_db()
+    except Exception:
+        rollback_db()
+        raise
+    return len(merge_ids)
+
+
+@app.route('/duplicates')
+@login_required
+def duplicates():
+    entity_type = request.args.get('type', 'individual')
+    if entity_type not in ENTITY_TABLES:
+        entity_type = 'individual'
+    table = ENTITY_TABLES[entity_type]
+    contact_col = 'email' if entity_type == 'individual' else 'website'
+    rows = query_db(
+        f'SELECT d.group_id, d.score, e.id, e.name, e.{contact_col} AS contact, e.linkedin_url, e.location, e.created_at '
+        f'FROM duplicate_candidates d JOIN {table} e ON e.id = d.entity_id '
+        f'WHERE d.entity_type = ? AND d.group_id IN '
+        f'(SELECT DISTINCT group_id FROM duplicate_candidates WHERE entity_type = ? ORDER BY group_id LIMIT 100) '
+        f'ORDER BY d.group_id, e.id',
+        (entity_type, entity_type)
+    )
+    groups = []
+    for group_id, members in itertools.groupby(rows, key=lambda r: r['group_id']):
+        members = list(members)
+        if len(members) > 1:
+            groups.append({'group_id': group_id, 'members': members})
+    return render_template('duplicates.html', groups=groups, entity_type=entity_type)
+
+
+@app.route('/duplicates/scan', methods=['POST'])
+@login_required
+def scan_duplicates():
+    entity_type = request.form.get('entity_type', 'individual')
+    if entity_type not in ENTITY_TABLES:
+        flash('Invalid type.', 'error')
+        return redirect(url_for('duplicates'))
+    job_id = enqueue_job('dedupe', {'entity_type': entity_type})
+    flash('Duplicate scan started.', 'success')
+    return redirect(url_for('job_status', id=job_id))
+
+
+@app.route('/duplicates/merge', methods=['POST'])
+@login_required
+def merge_duplicates():
+    entity_type = request.form.get('entity_type', 'individual')
+    if entity_type not in ENTITY_TABLES:
+        flash('Invalid type.', 'error')
+        return redirect(url_for('duplicates'))
+    keep_id = request.form.get('keep_id', type=int)
+    merge_ids = [int(i) for i in request.form.getlist('merge_ids') if i.isdigit()]
+    if not keep_id or not merge_ids:
+        flash('Choose a record to keep and at least one duplicate.', 'error')
+        return redirect(url_for('duplicates', type=entity_type))
+    merged = merge_entities(entity_type, keep_id, merge_ids)
+    flash(f'Merged {merged} record(s).', 'success')
+    return redirect(url_for('duplicates', type=entity_type))
+
+
+@app.cli.command('find-duplicates')
+@click.option('--type', 'entity_type', type=click.Choice(sorted(ENTITY_TABLES)), default=None,
+              help='Only scan one entity type (default: both).')
+def find_duplicates_command(entity_type):
+    """Rebuild duplicate merge suggestions."""
+    create_app()
+    for kind in [entity_type] if entity_type else sorted(ENTITY_TABLES):
+        found = refresh_duplicate_candidates(kind, progress=lambda n: click.echo(f'  {n} {kind} rows scanned'))
+        click.echo(f'{kind}: {found} possible duplicate group(s)')
+
+
 # --- Export / Import ---
 
-def serialize_row(row):
+EXPORT_TABLES = ['companies', 'individuals', 'relationships', 'notes',
+                 'follow_ups', 'follow_up_links', 'follow_up_comments', 'proposals', 'proposal_contacts',
+                 'proposal_events', 'archived_follow_ups', 'archived_follow_up_links', 'archived_follow_up_comments',
+                 'archived_proposals', 'archived_proposal_contacts']
+
+
+def serialize_row(row, sep='T'):
     """Convert a database row to a JSON-safe dict."""
     d = dict(row)
     for k, v in d.items():
         if isinstance(v, datetime):
-            d[k] = v.isoformat()
+            d[k] = v.isoformat(sep)
     return d
 
 
-@app.route('/export')
+def write_export(f, progress=None):
+    """Stream every table to `f` as one JSON document without holding a table in memory."""
+    rows_written = 0
+    f.write('{')
+    for t, table in enumerate(EXPORT_TABLES):
+        f.write(f'{"," if t else ""}\n  {json.dumps(table)}: [')
+        for n, row in enumerate(iter_query(f'SELECT * FROM {table} ORDER BY id')):
+            # Space-separated timestamps re-import in the same text form SQLite stores
+            record = json.dumps(serialize_row(row, sep=' '), default=str)
+            f.write(f'{"," if n else ""}\n    {record}')
+            rows_written += 1
+        f.write('\n  ]')
+        if progress:
+            progress(t + 1, len(EXPORT_TABLES), f'Exported {table}')
+    f.write('\n}\n')
+    return rows_written
+
+
+@app.route('/export', methods=['GET', 'POST'])
 @login_required
 def export_data():
-    tables = ['companies', 'individuals', 'relationships', 'notes',
-              'follow_ups', 'follow_up_links', 'follow_up_comments', 'proposals', 'proposal_contacts']
-    data = {}
-    for table in tables:
-        rows = query_db(f'SELECT * FROM {table}')
-        data[table] = [serialize_row(r) for r in rows]
-    output = json.dumps(data, indent=2, default=str)
-    return Response(
-        output,
-        mimetype='application/json',
-        headers={'Content-Disposition': 'attachment;filename=mini-crm-backup.json'}
-    )
+    if request.method == 'POST':
+        job_id = enqueue_job('export')
+        flash('Export started.', 'success')
+        return redirect(url_for('job_status', id=job_id))
+    recent = query_db("SELECT * FROM jobs WHERE kind = 'export' ORDER BY id DESC LIMIT 10")
+    return render_template('export.html', jobs=recent)
+
+
+def import_backup(data, progress=None):
+    """Replace all data with the contents of an exported backup."""
+    # Clear existing data in reverse dependency order
+    for table in ['archived_proposal_contacts', 'archived_proposals', 'archived_follow_up_comments',
+                  'archived_follow_up_links', 'archived_follow_ups',
+                  'proposal_events', 'proposal_contacts', 'proposals', 'follow_up_comments', 'follow_up_links', 'follow_ups',
+                  'notes', 'relationships', 'individuals', 'companies']:
+        query_db(f'DELETE FROM {table}')
+
+    # Insert data
+    for c in data.get('companies', []):
+        query_db('INSERT INTO companies (id, name, website, type, linkedin_url, location, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                 (c['id'], c['name'], c.get('website'), c.get('type'), c.get('linkedin_url'), c.get('location'), c.get('created_at')))
+    for i in data.get('individuals', []):
+        query_db('INSERT INTO individuals (id, name, title, email, phone, linkedin_url, location, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                 (i['id'], i['name'], i.get('title'), i.get('email'), i.get('phone'), i.get('linkedin_url'), i.get('location'), i.get('created_at')))
+    if progress:
+        progress(2, len(EXPORT_TABLES), 'Imported contacts')
+    for r in data.get('relationships', []):
+        query_db('INSERT INTO relationships (id, from_type, from_id, to_type, to_id, relationship_type, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                 (r['id'], r['from_type'], r['from_id'], r['to_type'], r['to_id'], r['relationship_type'], r.get('created_at')))
+    for n in data.get('notes', []):
+        query_db('INSERT INTO notes (id, entity_type, entity_id, note_text, created_at) VALUES (?, ?, ?, ?, ?)',
+                 (n['id'], n['entity_type'], n['entity_id'], n['note_text'], n.get('created_at')))
+    if progress:
+        progress(4, len(EXPORT_TABLES), 'Imported relationships and notes')
+    for fu in data.get('follow_ups', []):
+        query_db('INSERT INTO follow_ups (id, title, body, opp_type, closed_at, sort_order, priority_level, priority_order, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                 (fu['id'], fu['title'], fu.get('body'), fu.get('opp_type', 'TBD'), fu.get('closed_at'),
+                  fu.get('sort_order', 0), fu.get('priority_level', 0), fu.get('priority_order', 0), fu.get('created_at')))
+    for fl in data.get('follow_up_links', []):
+        query_db('INSERT INTO follow_up_links (id, follow_up_id, entity_type, entity_id) VALUES (?, ?, ?, ?) '
+                 'ON CONFLICT DO NOTHING',
+                 (fl['id'], fl['follow_up_id'], fl['entity_type'], fl['entity_id']))
+    for fc in data.get('follow_up_comments', []):
+        query_db('INSERT INTO follow_up_comments (id, follow_up_id, comment_text, created_at) VALUES (?, ?, ?, ?)',
+                 (fc['id'], fc['follow_up_id'], fc['comment_text'], fc.get('created_at')))
+    if progress:
+        progress(7, len(EXPORT_TABLES), 'Imported opportunities')
+    for pr in data.get('proposals', []):
+        query_db('INSERT INTO proposals (id, name, follow_up_id, onboarding_fee, onboarding_fee_max, monthly_retainer, monthly_retainer_max, status, date_sent, notes, scope_of_work, timeline, contact_person, follow_up_date, sent_on, follow_up_on, sort_order, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                 (pr['id'], pr['name'], pr.get('follow_up_id'), pr.get('onboarding_fee'), pr.get('onboarding_fee_max'),
+                  pr.get('monthly_retainer'), pr.get('monthly_retainer_max'),
+                  pr.get('status', 'Draft'), pr.get('date_sent'), pr.get('notes'), pr.get('scope_of_work'),
+                  pr.get('timeline'), pr.get('contact_person'), pr.get('follow_up_date'), pr.get('sent_on'), pr.get('follow_up_on'),
+                  pr.get('sort_order', 0), pr.get('created_at')))
+
+    for pc in data.get('proposal_contacts', []):
+        query_db('INSERT INTO proposal_contacts (id, proposal_id, individual_id) VALUES (?, ?, ?) ON CONFLICT DO NOTHING',
+                 (pc['id'], pc['proposal_id'], pc['individual_id']))
+    for pe in data.get('proposal_events', []):
+        query_db('INSERT INTO proposal_events (id, proposal_id, from_status, to_status, created_at) VALUES (?, ?, ?, ?, ?)',
+                 (pe['id'], pe['proposal_id'], pe.get('from_status'), pe['to_status'], pe.get('created_at')))
+
+    for table, columns in ARCHIVE_COLUMNS.items():
+        if table in ('follow_ups', 'proposals'):
+            columns += ('archived_at',)
+        insert_rows(f'archived_{table}', columns,
+                    [tuple(row.get(c) for c in columns) for row in data.get(f'archived_{table}', [])])
+
+    # Move id sequences past every id in use, archived ones included, so a restore never collides
+    for table in EXPORT_TABLES:
+        if table.startswith('archived_'):
+            continue
+        ids = f'SELECT id FROM {table}'
+        if table in ARCHIVE_COLUMNS:
+            ids += f' UNION ALL SELECT id FROM archived_{table}'
+        if USE_POSTGRES:
+            query_db(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                     f"COALESCE((SELECT MAX(id) FROM ({ids}) t), 0) + 1, false)")
+        elif table in ARCHIVE_COLUMNS:
+            query_db('DELETE FROM sqlite_sequence WHERE name = ?', (table,))
+            query_db(f'INSERT INTO sqlite_sequence (name, seq) SELECT ?, COALESCE(MAX(id), 0) FROM ({ids})', (table,))
+
+    # Backups from before the DATE columns only carry the text ones
+    backfill_proposal_dates()
+    rebuild_counters()
+    rebuild_funnel()
+    commit_db()
+    return {table: len(data.get(table, [])) for table in EXPORT_TABLES}
 
 
 @app.route('/import', methods=['GET', 'POST'])
@@ -1030,62 +2970,1101 @@ def import_data():
         if not file:
             flash('No file selected.', 'error')
             return redirect(url_for('import_data'))
+        job_id = enqueue_job('import', upload=file)
+        flash('Import started.', 'success')
+        return redirect(url_for('job_status', id=job_id))
+    return render_template('import.html')
+
+
+# --- CSV Contact Import ---
+
+CSV_BATCH_SIZE = int(os.environ.get('CSV_BATCH_SIZE', '1000'))
+CSV_MAX_REPORTED_ERRORS = 200
+CSV_FIELDS = {
+    'individual': ['name', 'title', 'email', 'phone', 'linkedin_url', 'location'],
+    'company': ['name', 'website', 'type', 'linkedin_url', 'location'],
+}
+CSV_HEADER_ALIASES = {
+    'name': 'name', 'full name': 'name', 'contact': 'name', 'contact name': 'name',
+    'first name': 'first_name', 'given name': 'first_name',
+    'last name': 'last_name', 'surname': 'last_name', 'family name': 'last_name',
+    'title': 'title', 'job title': 'title', 'position': 'title', 'role': 'title',
+    'email': 'email', 'email address': 'email', 'e mail': 'email',
+    'phone': 'phone', 'phone number': 'phone', 'mobile': 'phone', 'telephone': 'phone',
+    'linkedin': 'linkedin_url', 'linkedin url': 'linkedin_url', 'linkedin profile': 'linkedin_url',
+    'location': 'location', 'city': 'location', 'address': 'location',
+    'website': 'website', 'url': 'website', 'domain': 'website', 'web site': 'website',
+    'type': 'type', 'industry': 'type', 'company type': 'type',
+    'company': 'company', 'company name': 'company', 'organization': 'company', 'employer': 'company',
+}
+
+
+def map_csv_header(header, entity_type):
+    """Return {column index: field} for the columns we know how to import."""
+    fields = set(CSV_FIELDS[entity_type])
+    if entity_type == 'individual':
+        fields |= {'first_name', 'last_name', 'company'}
+    mapping = {}
+    for index, column in enumerate(header):
+        key = re.sub(r'[\s_\-]+', ' ', (column or '').strip().lower())
+        field = CSV_HEADER_ALIASES.get(key)
+        # A bare 'company'/'company name' column names the company itself on a company import
+        if entity_type == 'company' and field == 'company':
+            field = 'name'
+        if field in fields and field not in mapping.values():
+            mapping[index] = field
+    return mapping
+
+
+def csv_match_keys(record):
+    """The identities a row can match an existing contact on, email before LinkedIn URL."""
+    keys = []
+    if record.get('email'):
+        keys.append(('email', record['email'].lower()))
+    if record.get('linkedin_url'):
+        keys.append(('linkedin_url', record['linkedin_url']))
+    return keys
+
+
+def find_existing_by_key(table, keys):
+    """Map upsert keys to existing row ids with one indexed lookup per key kind."""
+    found = {}
+    emails = [value for kind, value in keys if kind == 'email']
+    urls = [value for kind, value in keys if kind == 'linkedin_url']
+    for batch in chunked(emails):
+        for row in query_db(f'SELECT id, lower(email) AS k FROM {table} WHERE lower(email) IN ({placeholders(len(batch))})', batch):
+            found.setdefault(('email', row['k']), row['id'])
+    for batch in chunked(urls):
+        for row in query_db(f'SELECT id, linkedin_url AS k FROM {table} WHERE linkedin_url IN ({placeholders(len(batch))})', batch):
+            found.setdefault(('linkedin_url', row['k']), row['id'])
+    return found
+
+
+def find_or_create_companies(names):
+    """Map lower-cased company names to ids, creating the ones that don't exist yet."""
+    ids = {}
+    for batch in chunked(set(names.keys())):
+        for row in query_db(f'SELECT id, lower(name) AS k FROM companies WHERE lower(name) IN ({placeholders(len(batch))})', batch):
+            # Several companies can share a name; link to the oldest
+            ids[row['k']] = min(row['id'], ids.get(row['k'], row['id']))
+    for key, name in names.items():
+        if key not in ids:
+            ids[key] = query_db('INSERT INTO companies (name) VALUES (?) RETURNING id', (name,), insert=True)
+    return ids
+
+
+def write_csv_batch(entity_type, records, link_companies, relationship_type):
+    """Upsert one batch; returns (inserted, updated, relationships) counts."""
+    table = ENTITY_TABLES[entity_type]
+    fields = CSV_FIELDS[entity_type]
+    # Rows sharing an email or LinkedIn URL are one contact. Later rows win, but never
+    # blank out a value from an earlier row
+    merged, match_keys, aliases, unkeyed = {}, {}, {}, []
+    for record in records:
+        keys = csv_match_keys(record)
+        if not keys:
+            unkeyed.append(record)
+            continue
+        key = next((aliases[k] for k in keys if k in aliases), None)
+        if key is None:
+            key = keys[0]
+            merged[key], match_keys[key] = record, []
+        else:
+            merged[key].update({f: v for f, v in record.items() if v})
+        for k in keys:
+            aliases.setdefault(k, key)
+            if k not in match_keys[key]:
+                match_keys[key].append(k)
+    found = find_existing_by_key(table, aliases.keys())
+    # Match on email first; when no email matches, fall back to the LinkedIn URL
+    existing = {key: next((found[k] for k in sorted(keys, key=lambda k: k[0] != 'email') if k in found), None)
+                for key, keys in match_keys.items()}
+    inserted = updated = relationships = 0
+
+    person_ids = []  # (individual id, record) pairs that need a company relationship
+    to_insert, plain_rows = [], []
+    # Blank cells leave the stored value alone
+    assignments = ', '.join(f"{f} = COALESCE(NULLIF(?, ''), {f})" for f in fields)
+    for key, record in merged.items():
+        row_id = existing.get(key)
+        if row_id is None:
+            to_insert.append(record)
+            continue
+        values = [record.get(f) or '' for f in fields]
+        query_db(f'UPDATE {table} SET {assignments} WHERE id = ?', values + [row_id])
+        updated += 1
+        if record.get('company'):
+            person_ids.append((row_id, record))
+    for record in to_insert + unkeyed:
+        values = tuple(record.get(f) or '' for f in fields)
+        if link_companies and record.get('company'):
+            # Only rows that need a relationship pay for an id round trip
+            new_id = query_db(f'INSERT INTO {table} ({", ".join(fields)}) VALUES ({placeholders(len(fields))}) RETURNING id',
+                              values, insert=True)
+            person_ids.append((new_id, record))
+        else:
+            plain_rows.append(values)
+        inserted += 1
+    insert_rows(table, fields, plain_rows)
+
+    if link_companies and person_ids:
+        company_ids = find_or_create_companies({r['company'].lower(): r['company'] for _, r in person_ids})
+        wanted = {(pid, company_ids[r['company'].lower()]) for pid, r in person_ids}
+        have = set()
+        for batch in chunked({pid for pid, _ in wanted}):
+            # Filter on to_type/relationship_type here so the planner sticks to the from_type/from_id index
+            rows = query_db(
+                f"SELECT from_id, to_type, to_id, relationship_type FROM relationships "
+                f"WHERE from_type = 'individual' AND from_id IN ({placeholders(len(batch))})",
+                batch
+            )
+            have.update((row['from_id'], row['to_id']) for row in rows
+                        if row['to_type'] == 'company' and row['relationship_type'] == relationship_type)
+        new_rels = [('individual', pid, 'company', cid, relationship_type) for pid, cid in sorted(wanted - have)]
+        insert_rows('relationships', ('from_type', 'from_id', 'to_type', 'to_id', 'relationship_type'), new_rels)
+        refresh_entity_counters('individual', [rel[1] for rel in new_rels])
+        refresh_entity_counters('company', [rel[3] for rel in new_rels])
+        relationships = len(new_rels)
+    return inserted, updated, relationships
+
+
+def import_contacts_csv(stream, entity_type, delimiter=',', link_companies=False,
+                        relationship_type='Works at', batch_size=CSV_BATCH_SIZE, progress=None):
+    """Stream a CSV/TSV of contacts into `entity_type`, upserting in batches.
+
+    Each batch is one transaction, so memory use is bounded by the batch size and
+    a bad batch only rolls back its own rows. Returns a stats dict including
+    per-row errors as (line number, message) pairs.
+    """
+    reader = csv.reader(stream, delimiter=delimiter)
+    stats = {'rows': 0, 'inserted': 0, 'updated': 0, 'relationships': 0,
+             'error_count': 0, 'errors': []}
+
+    def error(line, message):
+        stats['error_count'] += 1
+        if len(stats['errors']) < CSV_MAX_REPORTED_ERRORS:
+            stats['errors'].append((line, message))
+
+    header = next(reader, None)
+    mapping = map_csv_header(header or [], entity_type)
+    if 'name' not in mapping.values() and 'first_name' not in mapping.values():
+        error(1, 'No name column found in the header row.')
+        return stats
+
+    def flush(batch, first_line):
         try:
-            data = json.load(file)
-        except json.JSONDecodeError:
-            flash('Invalid JSON file.', 'error')
-            return redirect(url_for('import_data'))
+            inserted, updated, relationships = write_csv_batch(entity_type, batch, link_companies, relationship_type)
+            commit_db()
+            stats['inserted'] += inserted
+            stats['updated'] += updated
+            stats['relationships'] += relationships
+        except Exception as e:
+            rollback_db()
+            error(first_line, f'Batch of {len(batch)} rows starting here was rolled back: {e}')
+        if progress:
+            progress(stats)
+
+    batch, batch_line = [], None
+    for row in reader:
+        stats['rows'] += 1
+        line = reader.line_num
+        if not any(cell.strip() for cell in row):
+            continue
+        record = {field: row[index].strip() for index, field in mapping.items() if index < len(row)}
+        first, last = record.pop('first_name', ''), record.pop('last_name', '')
+        if not record.get('name'):
+            record['name'] = f'{first} {last}'.strip()
+        if not record['name']:
+            error(line, 'Missing name.')
+            continue
+        if record.get('email') and '@' not in record['email']:
+            error(line, f"Invalid email '{record['email']}'.")
+            continue
+        if batch_line is None:
+            batch_line = line
+        batch.append(record)
+        if len(batch) >= batch_size:
+            flush(batch, batch_line)
+            batch, batch_line = [], None
+    if batch:
+        flush(batch, batch_line)
+    return stats
+
+
+def csv_delimiter(filename, choice):
+    if choice in (',', ';', '|'):
+        return choice
+    if choice == 'tab' or (filename or '').lower().endswith(('.tsv', '.tab')):
+        return '\t'
+    return ','
+
+
+@app.route('/import/csv', methods=['GET', 'POST'])
+@login_required
+def import_csv():
+    if request.method == 'POST':
+        file = request.files.get('file')
+        entity_type = request.form.get('entity_type', 'individual')
+        if not file or not file.filename:
+            flash('No file selected.', 'error')
+            return redirect(url_for('import_csv'))
+        if entity_type not in CSV_FIELDS:
+            flash('Invalid type.', 'error')
+            return redirect(url_for('import_csv'))
+        job_id = enqueue_job('import_csv', {
+            'entity_type': entity_type,
+            'delimiter': csv_delimiter(file.filename, request.form.get('delimiter')),
+            'link_companies': entity_type == 'individual' and bool(request.form.get('link_companies')),
+            'relationship_type': request.form.get('relationship_type', '').strip() or 'Works at',
+        }, upload=file)
+        flash('CSV import started.', 'success')
+        return redirect(url_for('job_status', id=job_id))
+    return render_template('import_csv.html')
+
+
+@app.cli.command('import-csv')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--type', 'entity_type', type=click.Choice(sorted(CSV_FIELDS)), default='individual')
+@click.option('--delimiter', default='auto', help="',', ';', '|', 'tab' or 'auto' (by file extension).")
+@click.option('--link-companies', is_flag=True, help="Relate each person to the company named in a 'company' column.")
+@click.option('--relationship-type', default='Works at')
+def import_csv_command(path, entity_type, delimiter, link_companies, relationship_type):
+    """Upsert contacts from a CSV/TSV file."""
+    create_app()
+    with open(path, encoding='utf-8-sig', errors='replace', newline='') as f:
+        stats = import_contacts_csv(
+            f, entity_type, delimiter=csv_delimiter(path, delimiter),
+            link_companies=link_companies and entity_type == 'individual', relationship_type=relationship_type,
+            progress=lambda s: click.echo(f"  {s['rows']} rows read"),
+        )
+    for line, message in stats['errors']:
+        click.echo(f'line {line}: {message}', err=True)
+    click.echo(f"{stats['rows']} rows: {stats['inserted']} added, {stats['updated']} updated, "
+               f"{stats['relationships']} relationships, {stats['error_count']} errors")
 
-        # Clear existing data in reverse dependency order
-        for table in ['proposal_contacts', 'proposals', 'follow_up_comments', 'follow_up_links', 'follow_ups',
-                      'notes', 'relationships', 'individuals', 'companies']:
-            query_db(f'DELETE FROM {table}')
-
-        # Insert data
-        for c in data.get('companies', []):
-            query_db('INSERT INTO companies (id, name, website, type, linkedin_url, location, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
-                     (c['id'], c['name'], c.get('website'), c.get('type'), c.get('linkedin_url'), c.get('location'), c.get('created_at')))
-        for i in data.get('individuals', []):
-            query_db('INSERT INTO individuals (id, name, title, email, phone, linkedin_url, location, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
-                     (i['id'], i['name'], i.get('title'), i.get('email'), i.get('phone'), i.get('linkedin_url'), i.get('location'), i.get('created_at')))
-        for r in data.get('relationships', []):
-            query_db('INSERT INTO relationships (id, from_type, from_id, to_type, to_id, relationship_type, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
-                     (r['id'], r['from_type'], r['from_id'], r['to_type'], r['to_id'], r['relationship_type'], r.get('created_at')))
-        for n in data.get('notes', []):
-            query_db('INSERT INTO notes (id, entity_type, entity_id, note_text, created_at) VALUES (?, ?, ?, ?, ?)',
-                     (n['id'], n['entity_type'], n['entity_id'], n['note_text'], n.get('created_at')))
-        for fu in data.get('follow_ups', []):
-            query_db('INSERT INTO follow_ups (id, title, body, opp_type, closed_at, sort_order, priority_level, priority_order, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
-                     (fu['id'], fu['title'], fu.get('body'), fu.get('opp_type', 'TBD'), fu.get('closed_at'),
-                      fu.get('sort_order', 0), fu.get('priority_level', 0), fu.get('priority_order', 0), fu.get('created_at')))
-        for fl in data.get('follow_up_links', []):
-            query_db('INSERT INTO follow_up_links (id, follow_up_id, entity_type, entity_id) VALUES (?, ?, ?, ?)',
-                     (fl['id'], fl['follow_up_id'], fl['entity_type'], fl['entity_id']))
-        for fc in data.get('follow_up_comments', []):
-            query_db('INSERT INTO follow_up_comments (id, follow_up_id, comment_text, created_at) VALUES (?, ?, ?, ?)',
-                     (fc['id'], fc['follow_up_id'], fc['comment_text'], fc.get('created_at')))
-        for pr in data.get('proposals', []):
-            query_db('INSERT INTO proposals (id, name, follow_up_id, onboarding_fee, onboarding_fee_max, monthly_retainer, monthly_retainer_max, status, date_sent, notes, scope_of_work, timeline, contact_person, follow_up_date, sort_order, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
-                     (pr['id'], pr['name'], pr.get('follow_up_id'), pr.get('onboarding_fee'), pr.get('onboarding_fee_max'),
-                      pr.get('monthly_retainer'), pr.get('monthly_retainer_max'),
-                      pr.get('status', 'Draft'), pr.get('date_sent'), pr.get('notes'), pr.get('scope_of_work'),
-                      pr.get('timeline'), pr.get('contact_person'), pr.get('follow_up_date'), pr.get('sort_order', 0), pr.get('created_at')))
-
-        for pc in data.get('proposal_contacts', []):
-            query_db('INSERT INTO proposal_contacts (id, proposal_id, individual_id) VALUES (?, ?, ?)',
-                     (pc['id'], pc['proposal_id'], pc['individual_id']))
-
-        # Reset sequences for PostgreSQL
-        if USE_POSTGRES:
-            for table in ['companies', 'individuals', 'relationships', 'notes',
-                          'follow_ups', 'follow_up_links', 'follow_up_comments', 'proposals', 'proposal_contacts']:
-                query_db(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE((SELECT MAX(id) FROM {table}), 0) + 1, false)")
 
+# --- Background Jobs ---
+
+# Uploaded inputs and downloadable outputs are stored in job_files in chunks of this size,
+# so a worker on another host reads and writes them through the shared database
+JOB_FILE_CHUNK_BYTES = 1024 * 1024
+# 'external' leaves jobs to a separate `flask run-worker` process; 'thread' (for local
+# development) runs a worker thread inside each web process instead
+JOB_WORKER = os.environ.get('JOB_WORKER', 'external')
+JOB_POLL_SECONDS = float(os.environ.get('JOB_POLL_SECONDS', '2'))
+JOB_STALE_SECONDS = int(os.environ.get('JOB_STALE_SECONDS', '3600'))
+JOB_RETENTION_DAYS = int(os.environ.get('JOB_RETENTION_DAYS', '7'))
+JOB_HANDLERS = {}
+
+
+class JobError(Exception):
+    """A job failure that retrying won't fix (bad input, missing file)."""
+
+
+def job_handler(kind):
+    def register(f):
+        JOB_HANDLERS[kind] = f
+        return f
+    return register
+
+
+def db_timestamp(dt=None):
+    """Format a UTC time the way CURRENT_TIMESTAMP stores it."""
+    return (dt or datetime.now(timezone.utc)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def save_job_file(name, f):
+    """Store a binary file object in job_files and return its size; the caller commits."""
+    size, part = 0, 0
+    data = f.read(JOB_FILE_CHUNK_BYTES)
+    while True:
+        query_db('INSERT INTO job_files (name, part, data) VALUES (?, ?, ?)', (name, part, data))
+        size += len(data)
+        data = f.read(JOB_FILE_CHUNK_BYTES)
+        if not data:
+            return size
+        part += 1
+
+
+def job_file_size(name):
+    """Size of a stored job file in bytes, or None if there is no such file."""
+    row = query_db('SELECT COUNT(*) AS parts, SUM(LENGTH(data)) AS size FROM job_files WHERE name = ?',
+                   (name,), one=True)
+    return row['size'] if row['parts'] else None
+
+
+def iter_job_file(name):
+    for row in iter_query('SELECT data FROM job_files WHERE name = ? ORDER BY part', (name,), size=4):
+        yield bytes(row['data'])
+
+
+def open_job_file(name):
+    """Copy a stored job file into a local temporary file for a handler to read."""
+    f = tempfile.TemporaryFile()
+    for chunk in iter_job_file(name):
+        f.write(chunk)
+    f.seek(0)
+    return f
+
+
+def delete_job_files(names):
+    for batch in chunked(names):
+        query_db(f'DELETE FROM job_files WHERE name IN ({placeholders(len(batch))})', batch)
+
+
+def enqueue_job(kind, payload=None, upload=None, max_attempts=3):
+    """Queue a job and return its id. An uploaded file is stored for the worker to read."""
+    payload = dict(payload or {})
+    if upload is not None:
+        name = f'{uuid.uuid4().hex}-{secure_filename(upload.filename or "upload")}'
+        save_job_file(name, upload.stream)
+        payload['input'] = name
+        payload['filename'] = upload.filename
+    job_id = query_db('INSERT INTO jobs (kind, payload, max_attempts) VALUES (?, ?, ?) RETURNING id',
+                      (kind, json.dumps(payload), max_attempts), insert=True)
+    commit_db()
+    return job_id
+
+
+def claim_job():
+    """Atomically move the oldest runnable job to 'running' and return it."""
+    now = db_timestamp()
+    row = query_db("SELECT id FROM jobs WHERE status = 'queued' AND (run_after IS NULL OR run_after <= ?) "
+                   "ORDER BY id LIMIT 1", (now,), one=True)
+    if not row:
+        return None
+    # Another worker may have claimed it between the SELECT and here; the status check settles it
+    claimed = query_db("UPDATE jobs SET status = 'running', started_at = ?, attempts = attempts + 1, error = NULL "
+                       "WHERE id = ? AND status = 'queued' RETURNING id", (now, row['id']), insert=True)
+    commit_db()
+    if not claimed:
+        return None
+    return query_db('SELECT * FROM jobs WHERE id = ?', (claimed,), one=True)
+
+
+def run_job(job):
+    """Run a claimed job, recording its result or scheduling a retry."""
+    job_id = job['id']
+
+    def report(done, total=None, message=None):
+        # Written and committed on its own connection: on the handler's connection it would stay
+        # uncommitted, invisible and (on SQLite) holding the write lock until the handler returns
+        db = connect_db()
+        try:
+            if not USE_POSTGRES:
+                # Skip rather than wait while the handler itself holds the lock (import_backup)
+                db.execute('PRAGMA busy_timeout = 100')
+            db.execute(prepare_statement('UPDATE jobs SET progress = ? WHERE id = ?')[0],
+                       (json.dumps({'done': done, 'total': total, 'message': message}), job_id))
+            db.commit()
+        except Exception as e:
+            app.logger.warning('Could not record progress for job %s: %s', job_id, e)
+        finally:
+            db.close()
+            count_connection('closed', 'primary')
+
+    payload = json.loads(job['payload'] or '{}')
+    try:
+        handler = JOB_HANDLERS.get(job['kind'])
+        if handler is None:
+            raise JobError(f"Unknown job kind '{job['kind']}'.")
+        result = handler(payload, report) or {}
+        query_db("UPDATE jobs SET status = 'done', result = ?, finished_at = ? WHERE id = ?",
+                 (json.dumps(result, default=str), db_timestamp(), job_id))
         commit_db()
-        flash('Data imported successfully.', 'success')
-        return redirect(url_for('index'))
-    return render_template('import.html')
+    except Exception as e:
+        rollback_db()
+        if isinstance(e, JobError):
+            app.logger.warning('Job %s (%s) failed: %s', job_id, job['kind'], e)
+        else:
+            app.logger.exception('Job %s (%s) failed', job_id, job['kind'])
+        if isinstance(e, JobError) or job['attempts'] >= job['max_attempts']:
+            query_db("UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+                     (str(e) or type(e).__name__, db_timestamp(), job_id))
+        else:
+            backoff = timedelta(seconds=30 * 2 ** (job['attempts'] - 1))
+            query_db("UPDATE jobs SET status = 'queued', error = ?, run_after = ? WHERE id = ?",
+                     (str(e) or type(e).__name__, db_timestamp(datetime.now(timezone.utc) + backoff), job_id))
+        commit_db()
+        return
+    if payload.get('input'):
+        delete_job_files([payload['input']])
+        commit_db()
+
+
+def housekeep_jobs():
+    """Requeue jobs orphaned by a dead worker and prune old finished jobs and their files."""
+    stale = db_timestamp(datetime.now(timezone.utc) - timedelta(seconds=JOB_STALE_SECONDS))
+    query_db("UPDATE jobs SET status = 'queued', error = 'Worker stopped before finishing' "
+             "WHERE status = 'running' AND started_at < ?", (stale,))
+    cutoff = db_timestamp(datetime.now(timezone.utc) - timedelta(days=JOB_RETENTION_DAYS))
+    old = query_db("SELECT id, payload, result FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?", (cutoff,))
+    names = []
+    for job in old:
+        for name in (json.loads(job['payload'] or '{}').get('input'), json.loads(job['result'] or '{}').get('file')):
+            if name:
+                names += [name, name + '.gz']
+    delete_job_files(names)
+    for batch in chunked([job['id'] for job in old]):
+        query_db(f'DELETE FROM jobs WHERE id IN ({placeholders(len(batch))})', batch)
+    commit_db()
+
+
+def work_jobs(stop, burst=False):
+    """Claim and run jobs until `stop` is set (or, in burst mode, until the queue is empty)."""
+    last_housekeeping = 0
+    while not stop.is_set():
+        with app.app_context():
+            if time.monotonic() - last_housekeeping > 300:
+                housekeep_jobs()
+                schedule_due_digest()
+                last_housekeeping = time.monotonic()
+            job = claim_job()
+            if job:
+                run_job(job)
+                continue
+        if burst:
+            return
+        stop.wait(JOB_POLL_SECONDS)
+
+
+_worker_thread = None
+_worker_lock = threading.Lock()
+
+
+@app.before_request
+def ensure_job_worker():
+    """Start the in-process worker thread on the first request this process serves."""
+    global _worker_thread
+    if JOB_WORKER != 'thread' or (_worker_thread is not None and _worker_thread.is_alive()):
+        return
+    with _worker_lock:
+        if _worker_thread is None or not _worker_thread.is_alive():
+            _worker_thread = threading.Thread(target=work_jobs, args=(threading.Event(),),
+                                              name='crm-job-worker', daemon=True)
+            _worker_thread.start()
+
+
+@app.cli.command('run-worker')
+@click.option('--burst', is_flag=True, help='Exit once the queue is empty.')
+def run_worker_command(burst):
+    """Process background jobs until interrupted."""
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        # Finish the current job, then exit
+        signal.signal(sig, lambda *_: stop.set())
+    create_app()
+    click.echo('Worker started.')
+    work_jobs(stop, burst=burst)
+
+
+@job_handler('export')
+def export_job(payload, report):
+    name = f'{uuid.uuid4().hex}-mini-crm-backup.json'
+    with tempfile.TemporaryFile() as raw, tempfile.TemporaryFile() as packed:
+        text = io.TextIOWrapper(raw, encoding='utf-8')
+        rows = write_export(text, progress=report)
+        text.flush()
+        text.detach()
+        # A gzip copy for download_job_output; JSON backups shrink to a fraction of their size
+        raw.seek(0)
+        with gzip.GzipFile(fileobj=packed, mode='wb', compresslevel=6, mtime=0) as dst:
+            shutil.copyfileobj(raw, dst)
+        raw.seek(0)
+        packed.seek(0)
+        size = save_job_file(name, raw)
+        save_job_file(name + '.gz', packed)
+    count_transfer('export', rows, size)
+    return {'file': name, 'download_name': 'mini-crm-backup.json', 'rows': rows, 'bytes': size}
+
+
+@job_handler('import')
+def import_job(payload, report):
+    size = job_file_size(payload.get('input', ''))
+    if size is None:
+        raise JobError('Uploaded file is missing.')
+    try:
+        with open_job_file(payload['input']) as f:
+            data = json.load(io.TextIOWrapper(f, encoding='utf-8'))
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        raise JobError('Invalid JSON file.') from None
+    imported = import_backup(data, progress=report)
+    count_transfer('import', sum(imported.values()), size)
+    return {'imported': imported}
+
+
+@job_handler('import_csv')
+def import_csv_job(payload, report):
+    size = job_file_size(payload.get('input', ''))
+    if size is None:
+        raise JobError('Uploaded file is missing.')
+    with open_job_file(payload['input']) as raw:
+        f = io.TextIOWrapper(raw, encoding='utf-8-sig', errors='replace', newline='')
+        stats = import_contacts_csv(
+            f, payload['entity_type'], delimiter=payload.get('delimiter', ','),
+            link_companies=payload.get('link_companies', False),
+            relationship_type=payload.get('relationship_type', 'Works at'),
+            progress=lambda stats: report(stats['rows'], None, f"{stats['rows']} rows read"),
+        )
+    count_transfer('import_csv', stats['rows'], size)
+    return stats
+
+
+@job_handler('dedupe')
+def dedupe_job(payload, report):
+    kinds = [payload['entity_type']] if payload.get('entity_type') else sorted(ENTITY_TABLES)
+    found = {}
+    for kind in kinds:
+        found[kind] = refresh_duplicate_candidates(kind, progress=lambda n: report(n, None, f'{n} {kind} rows scanned'))
+    return {'groups': found}
+
+
+@job_handler('reindex')
+def reindex_job(payload, report):
+    # Refresh planner statistics so the indexes get picked after bulk loads
+    query_db('ANALYZE')
+    commit_db()
+    return {'analyzed': True}
+
+
+@job_handler('rebuild_counters')
+def rebuild_counters_job(payload, report):
+    rebuild_counters()
+    commit_db()
+    return {'rebuilt': True}
+
+
+@job_handler('archive')
+def archive_job(payload, report):
+    days = payload.get('days', ARCHIVE_AFTER_DAYS)
+    moved = archive_closed(days, progress=lambda moved: report(
+        sum(moved.values()), None, f"{moved['proposals']} proposals, {moved['follow_ups']} opportunities archived"))
+    return {'archived': moved, 'days': days}
+
+
+@job_handler('due_digest')
+def due_digest_job(payload, report):
+    through = date.fromisoformat(payload['through'])
+    since = date.fromisoformat(payload['since']) if payload.get('since') else None
+    # Newly due: came due since the previous digest. Overdue: already due then and still open.
+    newly_due = due_proposals(since + timedelta(days=1) if since else None, through)
+    overdue = due_proposals(end=since) if since else []
+    upcoming = due_proposals(through + timedelta(days=1), through + timedelta(days=DUE_WINDOW_DAYS))
+    digest = {'since': payload.get('since'), 'through': payload['through'],
+              'newly_due': [serialize_due(row, through) for row in newly_due],
+              'overdue': [serialize_due(row, through) for row in overdue],
+              'upcoming': [serialize_due(row, through) for row in upcoming]}
+    name = f'{uuid.uuid4().hex}-due-digest.json'
+    save_job_file(name, io.BytesIO(json.dumps(digest, indent=2).encode('utf-8')))
+    return {'file': name, 'download_name': f"due-digest-{payload['through']}.json",
+            'newly_due': len(newly_due), 'overdue': len(overdue), 'upcoming': len(upcoming)}
+
+
+@app.route('/jobs')
+@login_required
+def jobs():
+    recent = query_db('SELECT * FROM jobs ORDER BY id DESC LIMIT 50')
+    return render_template('jobs.html', jobs=[dict(j, progress=json.loads(j['progress'] or 'null')) for j in recent])
+
+
+@app.route('/jobs/reindex', methods=['POST'])
+@login_required
+def enqueue_reindex():
+    job_id = enqueue_job('reindex')
+    return redirect(url_for('job_status', id=job_id))
+
+
+@app.route('/jobs/rebuild-counters', methods=['POST'])
+@login_required
+def enqueue_rebuild_counters():
+    job_id = enqueue_job('rebuild_counters')
+    return redirect(url_for('job_status', id=job_id))
+
+
+@app.route('/jobs/archive', methods=['POST'])
+@login_required
+def enqueue_archive():
+    job_id = enqueue_job('archive', {'days': ARCHIVE_AFTER_DAYS})
+    return redirect(url_for('job_status', id=job_id))
+
+
+def load_job(id):
+    job = query_db('SELECT * FROM jobs WHERE id = ?', (id,), one=True)
+    if not job:
+        return None
+    job = dict(job)
+    for field in ('payload', 'progress', 'result'):
+        job[field] = json.loads(job[field]) if job[field] else None
+    return job
+
+
+@app.route('/jobs/<int:id>')
+@login_required
+def job_status(id):
+    job = load_job(id)
+    if not job:
+        flash('Job not found.', 'error')
+        return redirect(url_for('jobs'))
+    return render_template('job.html', job=job, job_worker=JOB_WORKER)
+
+
+@app.route('/api/jobs/<int:id>')
+@login_required
+def job_status_api(id):
+    job = load_job(id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    job['payload'] = {k: v for k, v in (job['payload'] or {}).items() if k != 'input'}
+    if job['status'] == 'done' and (job['result'] or {}).get('file'):
+        job['download_url'] = url_for('download_job_output', id=id)
+    return jsonify(serialize_row(job))
+
+
+@app.route('/jobs/<int:id>/download')
+@login_required
+def download_job_output(id):
+    job = load_job(id)
+    result = (job or {}).get('result') or {}
+    name = result.get('file')
+    size = job_file_size(name) if job and job['status'] == 'done' and name else None
+    if size is None:
+        flash('Download not available.', 'error')
+        return redirect(url_for('jobs'))
+    packed_size = job_file_size(name + '.gz') if request.accept_encodings['gzip'] else None
+    if packed_size is not None:
+        name, size = name + '.gz', packed_size
+    response = Response(stream_with_context(iter_job_file(name)), mimetype='application/json')
+    response.headers.set('Content-Disposition', 'attachment', filename=result.get('download_name', result['file']))
+    response.content_length = size
+    if packed_size is not None:
+        response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+@app.route('/jobs/<int:id>/retry', methods=['POST'])
+@login_required
+def retry_job(id):
+    query_db("UPDATE jobs SET status = 'queued', attempts = 0, run_after = NULL, finished_at = NULL "
+             "WHERE id = ? AND status = 'failed'", (id,))
+    commit_db()
+    return redirect(url_for('job_status', id=id))
+
+
+# --- Read Replica ---
+
+@app.cli.command('sync-replica')
+@click.option('--interval', default=0.0, help='Keep syncing every N seconds instead of once.')
+def sync_replica_command(interval):
+    """Copy the SQLite primary to SQLITE_READ_PATH, standing in for streaming replication."""
+    create_app()
+    if USE_POSTGRES or not SQLITE_READ_PATH:
+        raise click.ClickException('Set SQLITE_READ_PATH (and no DATABASE_URL); Postgres replicas use streaming replication.')
+    while True:
+        tmp_path = f'{SQLITE_READ_PATH}.tmp'
+        source, target = sqlite3.connect(SQLITE_PATH), sqlite3.connect(tmp_path)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+        # Swap the file in whole so readers never see a half-copied database
+        os.replace(tmp_path, SQLITE_READ_PATH)
+        click.echo(f'Synced {SQLITE_PATH} -> {SQLITE_READ_PATH}')
+        if not interval:
+            break
+        time.sleep(interval)
+
+
+# --- Statement Stats ---
+
+def statement_stats():
+    info = prepare_statement.cache_info()
+    lookups = info.hits + info.misses
+    stats = {
+        'registry': {'hits': info.hits, 'misses': info.misses, 'size': info.currsize, 'max_size': info.maxsize,
+                     'hit_rate': round(info.hits / lookups, 4) if lookups else None},
+        'backend': 'postgres' if USE_POSTGRES else 'sqlite',
+    }
+    if USE_POSTGRES:
+        # Server-side prepared statements held by this request's connection
+        row = query_db('SELECT count(*) AS prepared, COALESCE(sum(generic_plans), 0) AS generic_plans, '
+                       'COALESCE(sum(custom_plans), 0) AS custom_plans FROM pg_prepared_statements', one=True)
+        stats['prepared'] = dict(row, threshold=PG_PREPARE_THRESHOLD)
+    return stats
+
+
+@app.route('/api/stats/statements')
+@login_required
+def api_statement_stats():
+    return jsonify(statement_stats())
+
+
+@app.cli.command('bench-query')
+@click.option('--calls', default=20000, show_default=True, help='Calls per measurement.')
+def bench_query_command(calls):
+    """Measure query_db's per-call overhead with and without the statement registry."""
+    create_app()
+    sql = 'SELECT id, name FROM companies WHERE id = ?'
+    translate = prepare_statement.__wrapped__
+
+    def timed(label, fn):
+        began = time.perf_counter()
+        for n in range(calls):
+            fn(n)
+        elapsed = time.perf_counter() - began
+        click.echo(f'{label:<30} {elapsed / calls * 1e6:7.2f} us/call')
+
+    timed('translate + classify (no cache)', lambda n: translate(sql))
+    timed('registry lookup', lambda n: prepare_statement(sql))
+    timed('query_db round trip', lambda n: query_db(sql, (n % 100 + 1,), one=True))
+    click.echo(json.dumps(statement_stats(), default=str))
+
+
+# --- Metrics ---
+
+# Prometheus metrics at /metrics. Under gunicorn, PROMETHEUS_MULTIPROC_DIR (set
+# in gunicorn.conf.py) makes each worker write its samples to files there so a
+# scrape of any one worker reports the totals for all of them.
+try:
+    import prometheus_client
+    from prometheus_client import multiprocess
+    from prometheus_client.core import CounterMetricFamily
+except ImportError:
+    prometheus_client = None
+
+METRICS_ENABLED = prometheus_client is not None and os.environ.get('METRICS_ENABLED', '1') == '1'
+# If set, scrapers must send `Authorization: Bearer <token>`. With APP_PASSWORD set,
+# /metrics needs either this token or a logged-in session
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+RSS_SAMPLE_SECONDS = 10
+
+if METRICS_ENABLED:
+    REQUEST_COUNT = prometheus_client.Counter(
+        'crm_http_requests_total', 'HTTP requests served.', ['endpoint', 'method', 'status'])
+    REQUEST_LATENCY = prometheus_client.Histogram(
+        'crm_http_request_duration_seconds', 'Time to build the response, by endpoint.', ['endpoint'])
+    REQUEST_DB_TIME = prometheus_client.Histogram(
+        'crm_http_request_db_seconds', 'Time spent in database calls per request, by endpoint.', ['endpoint'])
+    REQUEST_RENDER_TIME = prometheus_client.Histogram(
+        'crm_http_request_render_seconds', 'Time spent rendering templates per request, by endpoint.', ['endpoint'])
+    DB_CONNECTIONS = prometheus_client.Counter(
+        'crm_db_connections_total', 'Database connections opened and closed.', ['event', 'role'])
+    PROCESS_RSS = prometheus_client.Gauge(
+        'crm_process_resident_memory_bytes', 'Resident memory of this process.', multiprocess_mode='all')
+
+_rss_sampled_at = 0.0
+
+
+def count_connection(event, role):
+    if METRICS_ENABLED:
+        DB_CONNECTIONS.labels(event, role).inc()
+
+
+def count_transfer(kind, rows, nbytes):
+    # Kept in the database rather than in this process: jobs run in `flask run-worker`,
+    # which may be on another host and serves no /metrics. Commits with the job's result.
+    query_db('INSERT INTO transfer_totals (kind, row_count, byte_count) VALUES (?, ?, ?) '
+             'ON CONFLICT (kind) DO UPDATE SET row_count = transfer_totals.row_count + excluded.row_count, '
+             'byte_count = transfer_totals.byte_count + excluded.byte_count', (kind, rows, nbytes))
+
+
+class TransferCollector:
+    """Reports transfer_totals as counters at scrape time."""
+
+    def collect(self):
+        rows = CounterMetricFamily('crm_transfer_rows', 'Rows moved by imports and exports.', labels=['kind'])
+        nbytes = CounterMetricFamily('crm_transfer_bytes', 'File bytes moved by imports and exports.', labels=['kind'])
+        for row in query_db('SELECT kind, row_count, byte_count FROM transfer_totals ORDER BY kind'):
+            rows.add_metric([row['kind']], row['row_count'])
+            nbytes.add_metric([row['kind']], row['byte_count'])
+        yield rows
+        yield nbytes
+
+
+def sample_rss(force=False):
+    """Record this process's RSS, at most every RSS_SAMPLE_SECONDS unless forced."""
+    global _rss_sampled_at
+    now = time.monotonic()
+    if not force and now - _rss_sampled_at < RSS_SAMPLE_SECONDS:
+        return
+    _rss_sampled_at = now
+    try:
+        with open('/proc/self/statm') as f:
+            PROCESS_RSS.set(int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE'))
+    except (OSError, ValueError):
+        pass
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@before_render_template.connect_via(app)
+def start_render_timer(sender, template, context, **extra):
+    g.render_started = time.perf_counter()
+
+
+@template_rendered.connect_via(app)
+def stop_render_timer(sender, template, context, **extra):
+    started = g.pop('render_started', None)
+    if started is not None:
+        g.render_seconds = g.get('render_seconds', 0.0) + (time.perf_counter() - started)
+
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if not METRICS_ENABLED or started is None or request.endpoint == 'metrics':
+        return response
+    endpoint = request.endpoint or 'unmatched'
+    REQUEST_COUNT.labels(endpoint, request.method, str(response.status_code)).inc()
+    REQUEST_LATENCY.labels(endpoint).observe(time.perf_counter() - started)
+    REQUEST_DB_TIME.labels(endpoint).observe(g.get('db_seconds', 0.0))
+    REQUEST_RENDER_TIME.labels(endpoint).observe(g.get('render_seconds', 0.0))
+    sample_rss()
+    return response
+
+
+@app.route('/metrics')
+def metrics():
+    if not METRICS_ENABLED:
+        return jsonify({'error': 'Metrics are disabled'}), 404
+    has_token = bool(METRICS_TOKEN) and hmac.compare_digest(request.headers.get('Authorization', ''),
+                                                            f'Bearer {METRICS_TOKEN}')
+    logged_in = bool(APP_PASSWORD) and session.get('logged_in')
+    if (METRICS_TOKEN or APP_PASSWORD) and not (has_token or logged_in):
+        return jsonify({'error': 'Unauthorized'}), 401
+    sample_rss(force=True)
+    registry = prometheus_client.CollectorRegistry()
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry.register(prometheus_client.REGISTRY)
+    registry.register(TransferCollector())
+    return Response(prometheus_client.generate_latest(registry), mimetype=prometheus_client.CONTENT_TYPE_LATEST)
+
+
+# --- Static Assets ---
+
+# `flask build-assets` minifies and fingerprints these into static/dist, next to
+# .gz/.br copies and a manifest; asset_url() switches to the built files once it exists
+ASSET_SOURCES = ['css/style.css', 'js/dashboard.js', 'js/proposals.js', 'vendor/Sortable.min.js']
+# Third-party files the build extracts into static/vendor (gitignored) from a pinned npm
+# tarball, checked against the registry's published integrity hash: (tarball URL, integrity,
+# file in the tarball, CDN URL of the same file used until a build has it)
+VENDOR_ASSETS = {
+    'vendor/Sortable.min.js': (
+        'https://registry.npmjs.org/sortablejs/-/sortablejs-1.15.7.tgz',
+        'sha512-Kk8wLQPlS+yi1ZEf48a4+fzHa4yxjC30M/Sr2AnQu+f/MPwvvX9XjZ6OWejiz8crBsLwSq8GHqaxaET7u6ux0A==',
+        'package/Sortable.min.js',
+        'https://cdn.jsdelivr.net/npm/sortablejs@1.15.7/Sortable.min.js',
+    ),
+}
+ASSETS_DIST = os.path.join(app.static_folder, 'dist')
+ASSET_MAX_AGE = 365 * 24 * 3600
+# Dynamic responses below this size go out uncompressed; gzip wouldn't save a round trip
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', '1024'))
+COMPRESS_LEVEL = 6
+COMPRESS_MIMETYPES = {'text/html', 'application/json', 'text/plain', 'text/csv'}
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+_asset_manifest = None
+
+
+def asset_manifest():
+    """The build's source path -> fingerprinted path map, read once per process ({} before a build)."""
+    global _asset_manifest
+    if _asset_manifest is None:
+        try:
+            with open(os.path.join(ASSETS_DIST, 'manifest.json'), encoding='utf-8') as f:
+                _asset_manifest = json.load(f)
+        except (OSError, ValueError):
+            _asset_manifest = {}
+    return _asset_manifest
+
+
+@app.template_global()
+def asset_url(path):
+    """URL for a static asset: its fingerprinted build if there is one, else the source file.
+
+    A vendor file the build hasn't downloaded yet falls back to its CDN URL.
+    """
+    built = asset_manifest().get(path)
+    if built:
+        return url_for('built_asset', filename=built)
+    if path in VENDOR_ASSETS and not os.path.exists(os.path.join(app.static_folder, path)):
+        return VENDOR_ASSETS[path][3]
+    return url_for('static', filename=path)
+
+
+@app.route('/assets/<path:filename>')
+def built_asset(filename):
+    """Serve a fingerprinted build file, precompressed when the client accepts it.
+
+    The name changes whenever the content does, so clients may cache it for good.
+    """
+    path = safe_join(ASSETS_DIST, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    mimetype = mimetypes.guess_type(path)[0]
+    encoding = next((e for e, suffix in (('br', '.br'), ('gzip', '.gz'))
+                     if request.accept_encodings[e] and os.path.isfile(path + suffix)), None)
+    if encoding:
+        response = send_file(path + ('.br' if encoding == 'br' else '.gz'), mimetype=mimetype, conditional=True)
+        response.headers['Content-Encoding'] = encoding
+    else:
+        response = send_file(path, mimetype=mimetype, conditional=True)
+    response.headers['Cache-Control'] = f'public, max-age={ASSET_MAX_AGE}, immutable'
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+@app.after_request
+def compress_response(response):
+    """Gzip large HTML/JSON/text responses for clients that accept it.
+
+    Files (send_file) and streams (the live-update feed) pass through untouched;
+    built assets and export downloads have their own precompressed copies.
+    """
+    if (response.direct_passthrough or response.is_streamed or response.status_code in (204, 206, 304)
+            or response.status_code < 200 or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESS_MIMETYPES or not request.accept_encodings['gzip']):
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+    response.set_data(gzip.compress(data, COMPRESS_LEVEL, mtime=0))
+    response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def minify_css(text):
+    # Comments and whitespace only; style.css has no strings whose spacing matters
+    text = re.sub(r'/\*.*?\*/', '', text, flags=re.S)
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'\s*([{};,>])\s*', r'\1', text)
+    text = re.sub(r'([{;])\s*([\w-]+)\s*:\s*', r'\1\2:', text)
+    return text.replace(';}', '}').strip() + '\n'
+
+
+def minify_js(text):
+    # Drops comment-only lines, indentation and blank lines but keeps line breaks,
+    # so automatic semicolon insertion reads the code exactly as before
+    lines = (line.strip() for line in text.splitlines())
+    return '\n'.join(line for line in lines if line and not line.startswith('//')) + '\n'
+
+
+def sri_digest(data, integrity):
+    """Whether `data` matches a Subresource Integrity string such as 'sha512-<base64>'."""
+    algorithm, _, expected = integrity.partition('-')
+    return base64.b64encode(hashlib.new(algorithm, data).digest()).decode('ascii') == expected
+
+
+def fetch_vendor_assets():
+    """Extract missing or outdated VENDOR_ASSETS into static/; returns the paths still missing.
+
+    A file is only written once its tarball matches the pinned integrity, which is
+    recorded next to it so a changed pin downloads again.
+    """
+    missing = []
+    for path, (url, integrity, member, _cdn) in VENDOR_ASSETS.items():
+        target = os.path.join(app.static_folder, path)
+        try:
+            with open(target + '.integrity', encoding='ascii') as f:
+                if f.read().strip() == integrity and os.path.exists(target):
+                    continue
+        except OSError:
+            pass
+        try:
+            with urllib.request.urlopen(url, timeout=30) as resp:
+                tarball = resp.read()
+        except OSError as e:
+            app.logger.warning('Could not download %s: %s', url, e)
+            missing.append(path)
+            continue
+        if not sri_digest(tarball, integrity):
+            app.logger.warning('%s does not match its pinned integrity; not using it', url)
+            missing.append(path)
+            continue
+        with tarfile.open(fileobj=io.BytesIO(tarball), mode='r:gz') as tar:
+            data = tar.extractfile(member).read()
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target + '.tmp', 'wb') as f:
+            f.write(data)
+        os.replace(target + '.tmp', target)
+        with open(target + '.integrity', 'w', encoding='ascii') as f:
+            f.write(integrity + '\n')
+    return missing
+
+
+def build_assets():
+    """Write minified, fingerprinted copies of ASSET_SOURCES with .gz/.br variants and a manifest.
+
+    Returns {source path: (built path, raw bytes, built bytes, gzip bytes, brotli bytes or None)}.
+    """
+    global _asset_manifest
+    missing = fetch_vendor_assets()
+    previous = set(asset_manifest().values())
+    manifest, stats = {}, {}
+    for path in ASSET_SOURCES:
+        if path in missing:
+            continue
+        with open(os.path.join(app.static_folder, path), encoding='utf-8') as f:
+            source = f.read()
+        stem, ext = os.path.splitext(path)
+        if stem.endswith('.min'):
+            built = source
+        else:
+            built = minify_css(source) if ext == '.css' else minify_js(source)
+        data = built.encode('utf-8')
+        name = f'{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}'
+        target = os.path.join(ASSETS_DIST, name)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        variants = {'': data, '.gz': gzip.compress(data, 9, mtime=0)}
+        if brotli is not None:
+            variants['.br'] = brotli.compress(data, quality=11)
+        for suffix, content in variants.items():
+            with open(target + suffix, 'wb') as f:
+                f.write(content)
+        manifest[path] = name
+        stats[path] = (name, len(source.encode('utf-8')), len(data), len(variants['.gz']),
+                       len(variants['.br']) if '.br' in variants else None)
+    os.makedirs(ASSETS_DIST, exist_ok=True)
+    with open(os.path.join(ASSETS_DIST, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    # Keep the previous build for pages rendered before this one; anything older goes
+    keep = previous | set(manifest.values())
+    for root, dirs, files in os.walk(ASSETS_DIST):
+        for file in files:
+            name = os.path.relpath(os.path.join(root, file), ASSETS_DIST).replace(os.sep, '/')
+            if name != 'manifest.json' and re.sub(r'\.(gz|br)$', '', name) not in keep:
+                os.remove(os.path.join(root, file))
+    _asset_manifest = manifest
+    return stats
+
+
+@app.cli.command('build-assets')
+def build_assets_command():
+    """Vendor, minify, fingerprint and precompress the static assets into static/dist."""
+    stats = build_assets()
+    for path in ASSET_SOURCES:
+        if path not in stats:
+            click.echo(f'{path:<24} skipped (download failed or did not match its integrity; '
+                       f'pages keep using {VENDOR_ASSETS[path][3]})')
+            continue
+        name, raw, built, gz, br = stats[path]
+        click.echo(f'{path:<24} -> dist/{name}  {raw:,} B raw, {built:,} B minified, {gz:,} B gzip'
+                   + (f', {br:,} B brotli' if br is not None else ''))
+    if brotli is None:
+        click.echo('Brotli is not installed; only gzip variants were written.')
 
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    create_app().run(debug=True)
@@ -0,0 +1,35 @@
+import os
+import tempfile
+
+# Workers write Prometheus samples to files here so /metrics can add them up
+# across processes. Set before the app (and prometheus_client) is imported.
+metrics_dir = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR',
+                                    os.path.join(tempfile.gettempdir(), 'mini-crm-metrics'))
+# Must exist before the preloaded app creates its metrics, which happens before on_starting
+os.makedirs(metrics_dir, exist_ok=True)
+
+# Imported up front: importing inside child_exit can re-enter from the SIGCHLD handler
+from prometheus_client import multiprocess
+
+wsgi_app = 'app:create_app()'
+# Import and initialize the app once in the master; workers share it copy-on-write
+preload_app = True
+
+
+def on_starting(server):
+    # Drop files left by a previous run so its counters aren't added in; keep the master's own
+    own = f'_{os.getpid()}.db'
+    for name in os.listdir(metrics_dir):
+        if not name.endswith(own):
+            os.remove(os.path.join(metrics_dir, name))
+
+
+def post_fork(server, worker):
+    # create_app() closes its connections before returning; this clears the rest of the inherited state
+    from app import reset_after_fork
+    reset_after_fork()
+
+
+def child_exit(server, worker):
+    # Drop the dead worker's live gauges (RSS); its counters and histograms are kept
+    multiprocess.mark_process_dead(worker.pid)
@@ -6,6 +6,9 @@ CREATE TABLE IF NOT EXISTS companies (
     linkedin_url TEXT,
     location TEXT,
     sort_order INTEGER DEFAULT 0,
+    note_count INTEGER DEFAULT 0,
+    relationship_count INTEGER DEFAULT 0,
+    open_follow_up_count INTEGER DEFAULT 0,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
@@ -18,6 +21,9 @@ CREATE TABLE IF NOT EXISTS individuals (
     linkedin_url TEXT,
     location TEXT,
     sort_order INTEGER DEFAULT 0,
+    note_count INTEGER DEFAULT 0,
+    relationship_count INTEGER DEFAULT 0,
+    open_follow_up_count INTEGER DEFAULT 0,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
@@ -48,6 +54,13 @@ CREATE TABLE IF NOT EXISTS follow_ups (
     sort_order INTEGER DEFAULT 0,
     priority_level INTEGER DEFAULT 0,
     priority_order INTEGER DEFAULT 0,
+    comment_count INTEGER DEFAULT 0,
+    draft_proposal_count INTEGER DEFAULT 0,
+    sent_proposal_count INTEGER DEFAULT 0,
+    negotiating_proposal_count INTEGER DEFAULT 0,
+    won_proposal_count INTEGER DEFAULT 0,
+    lost_proposal_count INTEGER DEFAULT 0,
+    pipeline_retainer REAL DEFAULT 0,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
@@ -80,6 +93,8 @@ CREATE TABLE IF NOT EXISTS proposals (
     timeline TEXT,
     contact_person TEXT,
     follow_up_date TEXT,
+    sent_on DATE,
+    follow_up_on DATE,
     sort_order INTEGER DEFAULT 0,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
@@ -90,6 +105,151 @@ CREATE TABLE IF NOT EXISTS proposal_contacts (
     individual_id INTEGER NOT NULL REFERENCES individuals(id)
 );
 
+CREATE TABLE IF NOT EXISTS proposal_events (
+    id SERIAL PRIMARY KEY,
+    proposal_id INTEGER NOT NULL,
+    from_status TEXT,
+    to_status TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Funnel rollups maintained from proposal_events (see apply_funnel_event)
+CREATE TABLE IF NOT EXISTS proposal_funnel (
+    proposal_id INTEGER PRIMARY KEY,
+    cohort_month TEXT NOT NULL,
+    max_rank INTEGER NOT NULL DEFAULT -1,
+    lost INTEGER NOT NULL DEFAULT 0,
+    stage TEXT,
+    stage_entered_at TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS funnel_reached (
+    cohort_month TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    proposals INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (cohort_month, stage)
+);
+
+CREATE TABLE IF NOT EXISTS funnel_stage_days (
+    month TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    days INTEGER NOT NULL,
+    proposals INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (month, stage, days)
+);
+
+CREATE TABLE IF NOT EXISTS duplicate_candidates (
+    id SERIAL PRIMARY KEY,
+    entity_type TEXT NOT NULL,
+    group_id INTEGER NOT NULL,
+    entity_id INTEGER NOT NULL,
+    score REAL
+);
+
+CREATE TABLE IF NOT EXISTS jobs (
+    id SERIAL PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    payload TEXT,
+    progress TEXT,
+    result TEXT,
+    error TEXT,
+    attempts INTEGER DEFAULT 0,
+    max_attempts INTEGER DEFAULT 3,
+    run_after TIMESTAMP,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
+-- Follow-ups changed by a dashboard action, tailed by the live-update event stream
+CREATE TABLE IF NOT EXISTS ui_events (
+    id SERIAL PRIMARY KEY,
+    follow_up_id INTEGER NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Job uploads and outputs, stored in chunks so a worker on another host can reach them
+CREATE TABLE IF NOT EXISTS job_files (
+    name TEXT NOT NULL,
+    part INTEGER NOT NULL,
+    data BYTEA NOT NULL,
+    PRIMARY KEY (name, part)
+);
+
+-- Rows and bytes moved by import/export jobs, reported by /metrics
+CREATE TABLE IF NOT EXISTS transfer_totals (
+    kind TEXT PRIMARY KEY,
+    row_count BIGINT NOT NULL DEFAULT 0,
+    byte_count BIGINT NOT NULL DEFAULT 0
+);
+
+-- One row per scheduled job run (see schedule_due_digest); the unique key makes it once across workers
+CREATE TABLE IF NOT EXISTS scheduled_runs (
+    id SERIAL PRIMARY KEY,
+    name TEXT NOT NULL,
+    period TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (name, period)
+);
+
+-- Cold storage for closed opportunities and finished proposals (see archive_closed).
+-- Rows keep their original ids; counter caches are recomputed when a row is restored.
+CREATE TABLE IF NOT EXISTS archived_follow_ups (
+    id INTEGER PRIMARY KEY,
+    title TEXT NOT NULL,
+    body TEXT,
+    opp_type TEXT,
+    closed_at TIMESTAMP,
+    sort_order INTEGER DEFAULT 0,
+    priority_level INTEGER DEFAULT 0,
+    priority_order INTEGER DEFAULT 0,
+    created_at TIMESTAMP,
+    archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS archived_follow_up_links (
+    id INTEGER PRIMARY KEY,
+    follow_up_id INTEGER NOT NULL,
+    entity_type TEXT NOT NULL,
+    entity_id INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS archived_follow_up_comments (
+    id INTEGER PRIMARY KEY,
+    follow_up_id INTEGER NOT NULL,
+    comment_text TEXT NOT NULL,
+    created_at TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS archived_proposals (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    follow_up_id INTEGER,
+    onboarding_fee REAL,
+    onboarding_fee_max REAL,
+    monthly_retainer REAL,
+    monthly_retainer_max REAL,
+    status TEXT,
+    date_sent TEXT,
+    notes TEXT,
+    scope_of_work TEXT,
+    timeline TEXT,
+    contact_person TEXT,
+    follow_up_date TEXT,
+    sent_on DATE,
+    follow_up_on DATE,
+    sort_order INTEGER DEFAULT 0,
+    created_at TIMESTAMP,
+    archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS archived_proposal_contacts (
+    id INTEGER PRIMARY KEY,
+    proposal_id INTEGER NOT NULL,
+    individual_id INTEGER NOT NULL
+);
+
 -- Add sort_order columns if they don't exist (for existing databases)
 DO $$ BEGIN
     ALTER TABLE companies ADD COLUMN IF NOT EXISTS sort_order INTEGER DEFAULT 0;
@@ -106,4 +266,61 @@ DO $$ BEGIN
     ALTER TABLE proposals ADD COLUMN IF NOT EXISTS monthly_retainer REAL;
     ALTER TABLE proposals ADD COLUMN IF NOT EXISTS onboarding_fee_max REAL;
     ALTER TABLE proposals ADD COLUMN IF NOT EXISTS monthly_retainer_max REAL;
+    -- Normalized dates (filled from the text columns by backfill_proposal_dates)
+    ALTER TABLE proposals ADD COLUMN IF NOT EXISTS sent_on DATE;
+    ALTER TABLE proposals ADD COLUMN IF NOT EXISTS follow_up_on DATE;
+    ALTER TABLE archived_proposals ADD COLUMN IF NOT EXISTS sent_on DATE;
+    ALTER TABLE archived_proposals ADD COLUMN IF NOT EXISTS follow_up_on DATE;
+    -- Counter caches (filled by flask rebuild-counters)
+    ALTER TABLE companies ADD COLUMN IF NOT EXISTS note_count INTEGER DEFAULT 0;
+    ALTER TABLE companies ADD COLUMN IF NOT EXISTS relationship_count INTEGER DEFAULT 0;
+    ALTER TABLE companies ADD COLUMN IF NOT EXISTS open_follow_up_count INTEGER DEFAULT 0;
+    ALTER TABLE individuals ADD COLUMN IF NOT EXISTS note_count INTEGER DEFAULT 0;
+    ALTER TABLE individuals ADD COLUMN IF NOT EXISTS relationship_count INTEGER DEFAULT 0;
+    ALTER TABLE individuals ADD COLUMN IF NOT EXISTS open_follow_up_count INTEGER DEFAULT 0;
+    ALTER TABLE follow_ups ADD COLUMN IF NOT EXISTS comment_count INTEGER DEFAULT 0;
+    ALTER TABLE follow_ups ADD COLUMN IF NOT EXISTS draft_proposal_count INTEGER DEFAULT 0;
+    ALTER TABLE follow_ups ADD COLUMN IF NOT EXISTS sent_proposal_count INTEGER DEFAULT 0;
+    ALTER TABLE follow_ups ADD COLUMN IF NOT EXISTS negotiating_proposal_count INTEGER DEFAULT 0;
+    ALTER TABLE follow_ups ADD COLUMN IF NOT EXISTS won_proposal_count INTEGER DEFAULT 0;
+    ALTER TABLE follow_ups ADD COLUMN IF NOT EXISTS lost_proposal_count INTEGER DEFAULT 0;
+    ALTER TABLE follow_ups ADD COLUMN IF NOT EXISTS pipeline_retainer REAL DEFAULT 0;
 END $$;
+
+CREATE INDEX IF NOT EXISTS idx_relationships_from ON relationships (from_type, from_id);
+CREATE INDEX IF NOT EXISTS idx_relationships_to ON relationships (to_type, to_id);
+CREATE INDEX IF NOT EXISTS idx_duplicate_candidates_group ON duplicate_candidates (entity_type, group_id);
+CREATE INDEX IF NOT EXISTS idx_individuals_email ON individuals (lower(email));
+CREATE INDEX IF NOT EXISTS idx_individuals_linkedin ON individuals (linkedin_url);
+CREATE INDEX IF NOT EXISTS idx_companies_linkedin ON companies (linkedin_url);
+CREATE INDEX IF NOT EXISTS idx_companies_name_lower ON companies (lower(name));
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, id);
+CREATE INDEX IF NOT EXISTS idx_proposal_events_proposal ON proposal_events (proposal_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_proposal_events_created ON proposal_events (created_at, id);
+CREATE INDEX IF NOT EXISTS idx_notes_entity ON notes (entity_type, entity_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_notes_created ON notes (created_at, id);
+CREATE INDEX IF NOT EXISTS idx_follow_up_comments_follow_up ON follow_up_comments (follow_up_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_follow_up_comments_created ON follow_up_comments (created_at, id);
+CREATE INDEX IF NOT EXISTS idx_follow_ups_created ON follow_ups (created_at, id);
+CREATE INDEX IF NOT EXISTS idx_follow_ups_closed ON follow_ups (closed_at, id);
+CREATE INDEX IF NOT EXISTS idx_follow_up_links_entity ON follow_up_links (entity_type, entity_id);
+CREATE INDEX IF NOT EXISTS idx_proposals_follow_up ON proposals (follow_up_id);
+CREATE INDEX IF NOT EXISTS idx_proposal_contacts_individual ON proposal_contacts (individual_id);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_follow_up_links_unique ON follow_up_links (follow_up_id, entity_type, entity_id);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_proposal_contacts_unique ON proposal_contacts (proposal_id, individual_id);
+CREATE INDEX IF NOT EXISTS idx_companies_name ON companies (name, id);
+CREATE INDEX IF NOT EXISTS idx_companies_type ON companies ((COALESCE(type, '')), id);
+CREATE INDEX IF NOT EXISTS idx_companies_created ON companies ((COALESCE(created_at, '1970-01-01 00:00:00')), id);
+CREATE INDEX IF NOT EXISTS idx_individuals_name ON individuals (name, id);
+CREATE INDEX IF NOT EXISTS idx_individuals_title ON individuals ((COALESCE(title, '')), id);
+CREATE INDEX IF NOT EXISTS idx_individuals_email_sort ON individuals ((COALESCE(email, '')), id);
+CREATE INDEX IF NOT EXISTS idx_individuals_created ON individuals ((COALESCE(created_at, '1970-01-01 00:00:00')), id);
+CREATE INDEX IF NOT EXISTS idx_archived_follow_ups_closed ON archived_follow_ups (closed_at, id);
+CREATE INDEX IF NOT EXISTS idx_archived_follow_up_links_follow_up ON archived_follow_up_links (follow_up_id);
+CREATE INDEX IF NOT EXISTS idx_archived_follow_up_links_entity ON archived_follow_up_links (entity_type, entity_id);
+CREATE INDEX IF NOT EXISTS idx_archived_follow_up_comments_follow_up ON archived_follow_up_comments (follow_up_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_archived_proposals_follow_up ON archived_proposals (follow_up_id);
+CREATE INDEX IF NOT EXISTS idx_archived_proposals_archived ON archived_proposals (archived_at, id);
+CREATE INDEX IF NOT EXISTS idx_archived_proposal_contacts_proposal ON archived_proposal_contacts (proposal_id);
+CREATE INDEX IF NOT EXISTS idx_archived_proposal_contacts_individual ON archived_proposal_contacts (individual_id);
+CREATE INDEX IF NOT EXISTS idx_proposals_follow_up_on ON proposals (follow_up_on);
@@ -0,0 +1,130 @@
+function initSortable(elId, type) {
+    const el = document.getElementById(elId);
+    if (!el) return;
+    Sortable.create(el, {
+        handle: '.drag-handle',
+        animation: 150,
+        onEnd: function() {
+            const ids = Array.from(el.children)
+                .filter(c => c.dataset.id)
+                .map(c => c.dataset.id);
+            fetch('/reorder', {
+                method: 'POST',
+                headers: {'Content-Type': 'application/json'},
+                body: JSON.stringify({type: type, ids: ids})
+            });
+        }
+    });
+}
+initSortable('sortable-follow-ups', 'follow_ups');
+initSortable('sortable-priority', 'priority_follow_ups');
+initSortable('sortable-watch', 'watch_follow_ups');
+
+function toggleSection(header) {
+    const content = header.nextElementSibling;
+    const icon = header.querySelector('.collapse-icon');
+    const key = 'collapse-' + header.textContent.trim().split(' ')[1];
+    if (content.style.display === 'none') {
+        content.style.display = '';
+        icon.innerHTML = '&#9660;';
+        localStorage.removeItem(key);
+    } else {
+        content.style.display = 'none';
+        icon.innerHTML = '&#9654;';
+        localStorage.setItem(key, '1');
+    }
+}
+document.querySelectorAll('.collapsible').forEach(function(header) {
+    const key = 'collapse-' + header.textContent.trim().split(' ')[1];
+    if (localStorage.getItem(key)) {
+        header.nextElementSibling.style.display = 'none';
+        header.querySelector('.collapse-icon').innerHTML = '&#9654;';
+    }
+});
+
+function toggleOpp(detailsId, toggleEl) {
+    const details = document.getElementById(detailsId);
+    if (details.style.display === 'none') {
+        details.style.display = '';
+        toggleEl.innerHTML = '&#9660;';
+    } else {
+        details.style.display = 'none';
+        toggleEl.innerHTML = '&#9654;';
+    }
+}
+
+function editBody(fuId) {
+    const section = document.getElementById('body-section-' + fuId);
+    section.querySelector('.body-display').style.display = 'none';
+    section.querySelector('.body-edit-form').style.display = 'block';
+}
+function cancelEditBody(fuId) {
+    const section = document.getElementById('body-section-' + fuId);
+    section.querySelector('.body-display').style.display = '';
+    section.querySelector('.body-edit-form').style.display = 'none';
+}
+
+function editComment(commentId) {
+    const commentDiv = document.getElementById('comment-' + commentId);
+    commentDiv.querySelector('.comment-content').style.display = 'none';
+    commentDiv.querySelector('.comment-edit-form').style.display = 'block';
+}
+function cancelEditComment(commentId) {
+    const commentDiv = document.getElementById('comment-' + commentId);
+    commentDiv.querySelector('.comment-content').style.display = '';
+    commentDiv.querySelector('.comment-edit-form').style.display = 'none';
+}
+
+// Card actions post in the background and swap in only the cards the server sends back
+function applyCards(data) {
+    document.querySelectorAll('.follow-up-list[data-variant]').forEach(function(list) {
+        const html = data.cards[list.dataset.variant];
+        const old = list.querySelector('.follow-up-card[data-id="' + data.id + '"]');
+        if (!html) {
+            if (old) old.remove();
+            return;
+        }
+        const tpl = document.createElement('template');
+        tpl.innerHTML = html.trim();
+        const card = tpl.content.firstElementChild;
+        if (old) {
+            // Keep the card expanded if it was open before the update
+            const oldDetails = old.querySelector('.opp-details');
+            if (oldDetails && oldDetails.style.display !== 'none') {
+                card.querySelector('.opp-details').style.display = '';
+                card.querySelector('.opp-toggle').innerHTML = '&#9660;';
+            }
+            old.replaceWith(card);
+        } else {
+            list.prepend(card);
+        }
+    });
+    document.querySelectorAll('.follow-up-list[data-variant]').forEach(function(list) {
+        const empty = list.nextElementSibling;
+        if (empty && empty.classList.contains('empty')) {
+            empty.style.display = list.children.length ? 'none' : '';
+        }
+    });
+    const closedList = document.getElementById('closed-follow-ups');
+    document.getElementById('closed-count').textContent = closedList.children.length;
+    closedList.closest('.closed-opportunities').style.display = closedList.children.length ? '' : 'none';
+}
+
+function refreshCards(fuId) {
+    fetch('/follow-up/' + fuId + '/cards', {headers: {'Accept': 'application/json'}})
+        .then(function(resp) { return resp.ok ? resp.json() : null; })
+        .then(function(data) { if (data) applyCards(data); });
+}
+
+document.addEventListener('submit', function(e) {
+    const form = e.target;
+    if (!form.hasAttribute('data-partial') || !window.fetch) return;
+    e.preventDefault();
+    fetch(form.action, {method: 'POST', body: new FormData(form), headers: {'Accept': 'application/json'}})
+        .then(function(resp) {
+            // Not applied: post the form the ordinary way so the server can report the error
+            if (!resp.ok) return form.submit();
+            // Applied: if the cards can't be swapped in, reload rather than post the action again
+            return resp.json().then(applyCards).catch(function() { location.reload(); });
+        }, function() { form.submit(); });
+});
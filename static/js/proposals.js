@@ -0,0 +1,39 @@
+document.querySelectorAll('.pipeline-cards').forEach(function(el) {
+    new Sortable(el, {
+        group: 'pipeline',
+        animation: 150,
+        handle: '.drag-handle',
+        ghostClass: 'sortable-ghost',
+        chosenClass: 'sortable-chosen',
+        onEnd: function(evt) {
+            var target = evt.to;
+            var newStatus = target.dataset.status;
+            var itemId = evt.item.dataset.id;
+
+            // If moved to a different column, update status
+            if (evt.from !== evt.to) {
+                var form = document.createElement('form');
+                form.method = 'POST';
+                form.action = '/proposal/' + itemId + '/update-status';
+                var input = document.createElement('input');
+                input.type = 'hidden';
+                input.name = 'status';
+                input.value = newStatus;
+                form.appendChild(input);
+                document.body.appendChild(form);
+                form.submit();
+                return;
+            }
+
+            // Reorder within column
+            var ids = Array.from(target.querySelectorAll('.proposal-card')).map(function(card) {
+                return card.dataset.id;
+            });
+            fetch('/proposals/reorder', {
+                method: 'POST',
+                headers: {'Content-Type': 'application/json'},
+                body: JSON.stringify({ids: ids})
+            });
+        }
+    });
+});